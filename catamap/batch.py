@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+"""
+
+catamap.batch
+Batch rendering of world overmaps across a worker pool
+
+License: GPLv3
+Repo: <https://git.ycnrg.org/projects/GTOOL/repos/catamap>
+
+Copyright (c) 2019 J. Hipps <jacob@ycnrg.org>
+https://ycnrg.org/
+
+
+Output filename format:
+
+[outdir]/o.OMT_X.OMT_Y.Z.EXT - Overmap tile render at Z-level Z
+
+"""
+
+import os
+import sys
+import time
+import logging
+import multiprocessing
+
+from PIL import ImageFont
+
+from catamap.gamedata import GameData
+from catamap.parse_overmap import World, OvermapTile
+from catamap.parse_submap import render_segment, segment_output_path
+from catamap.tileset import Tileset
+from catamap.snapshot import GameDataSnapshot
+from catamap import __version__, __date__
+
+logger = logging.getLogger('catamap')
+
+# Exit codes
+EXIT_OK = 0             # All overmaps rendered (or skipped by --resume)
+EXIT_ERROR = 1          # Setup failed, nothing rendered
+EXIT_PARTIAL = 2        # Some overmaps failed
+EXIT_FAILED = 3         # All overmaps failed
+
+RENDER_FORMATS = ('png', 'webp', 'svg')
+
+# per-process render state, set up once by _init_worker() or init_segment_worker()
+_wstate = {}
+
+
+def output_path(outdir, x, y, z, fmt):
+    """
+    Returns output filename for overmap x,y at Z-level z
+    """
+    return os.path.join(outdir, 'o.%d.%d.%d.%s' % (x, y, z, fmt))
+
+def plan_jobs(world: World, outdir, fmt, xrange=None, yrange=None, zlevels=(0,), resume=False, visibility=None):
+    """
+    Returns (jobs, skipped), where @jobs is a list of (x, y, filename, zlevels, seen) for each overmap
+    to render, and @skipped is the number of overmaps skipped because all outputs exist.
+    @xrange and @yrange are inclusive (min, max) tuples, or None for all overmaps.
+    With @visibility, overmaps never seen at any of @zlevels are not rendered at all, and
+    @seen is the packed bitset used to mask the rest; otherwise @seen is None.
+    """
+    jobs = []
+    skipped = 0
+    unseen = 0
+    for omt_x, omt_y in world.list_tiles():
+        if xrange and not xrange[0] <= omt_x <= xrange[1]:
+            continue
+        if yrange and not yrange[0] <= omt_y <= yrange[1]:
+            continue
+        if visibility is not None and visibility.is_unseen(omt_x, omt_y, zlevels):
+            unseen += 1
+            continue
+
+        # outputs are renamed into place when finished, so any existing output is complete
+        zlist = [z for z in zlevels if not (resume and os.path.exists(output_path(outdir, omt_x, omt_y, z, fmt)))]
+        if not zlist:
+            skipped += 1
+            continue
+        seen = visibility.get_seen(omt_x, omt_y) if visibility is not None else None
+        jobs.append((omt_x, omt_y, world.tindex[(omt_x, omt_y)], zlist, seen))
+    if unseen:
+        logger.info("skipping %d overmaps that were never seen", unseen)
+    return (jobs, skipped)
+
+def _setup_worker(opts, setup):
+    """
+    Keep @opts and run @setup(opts) to fill in per-process render state
+    @returns error message on failure, which is also returned by every job, or None on success
+    """
+    _wstate.clear()
+    _wstate['opts'] = opts
+    _wstate['error'] = None
+    try:
+        setup(opts)
+    except Exception as e:
+        # exceptions raised from a Pool initializer make the pool respawn workers forever
+        _wstate['error'] = "worker setup failed: %s" % (str(e))
+        logger.error(_wstate['error'])
+    return _wstate['error']
+
+def _setup_overmap(opts):
+    """
+    Load game data and render resources for overmap jobs
+    With opts['snapshot'] set, workers attach to the parent's snapshot instead of parsing game data
+    """
+    if opts.get('snapshot'):
+        _wstate['gdata'] = GameDataSnapshot(opts['snapshot'])
+    else:
+        _wstate['gdata'] = GameData(opts['gamepath'])
+    _wstate['tileset'] = Tileset(opts['tileset'], tilesize=opts.get('tilesize')) if opts.get('tileset') else None
+    if opts.get('font') and _wstate['tileset'] is None and opts.get('format') != 'svg':
+        ImageFont.FreeTypeFont(opts['font'], size=opts['fontsize'])
+
+def _setup_segment(opts):
+    """
+    Attach to the parent's snapshot (or symbol table) for segment jobs; workers never parse game data
+    """
+    if opts.get('snapshot'):
+        _wstate['symtab'] = GameDataSnapshot(opts['snapshot'])
+    else:
+        _wstate['symtab'] = opts['symtab']
+    ImageFont.FreeTypeFont(opts['font'], size=opts['fontsize'])
+
+def _init_worker(opts):
+    """
+    Set up a worker process for _render_job()
+    @returns error message on failure, or None on success
+    """
+    return _setup_worker(opts, _setup_overmap)
+
+def init_segment_worker(opts):
+    """
+    Set up a worker process for render_segment_job()
+    @returns error message on failure, or None on success
+    """
+    return _setup_worker(opts, _setup_segment)
+
+def _render_job(job):
+    """
+    Render all requested Z-levels of a single overmap
+    @returns (x, y, number of outputs written, error message or None)
+    """
+    omt_x, omt_y, filename, zlist, seen = job
+    if _wstate.get('error'):
+        return (omt_x, omt_y, 0, _wstate['error'])
+    opts = _wstate['opts']
+    written = 0
+    try:
+        otile = OvermapTile(omt_x, omt_y, filename)
+        if otile.layers is None:
+            return (omt_x, omt_y, 0, "failed to parse %s" % (filename))
+        otile.resolve_symbols(_wstate['gdata'])
+        otile.set_seen(seen)
+
+        for z in zlist:
+            outpath = output_path(opts['outdir'], omt_x, omt_y, z, opts['format'])
+            tmppath = outpath + '.tmp'
+            if opts['format'] == 'svg':
+                otile.render_overmap_svg(tmppath, fontsize=opts['fontsize'], z=z)
+            else:
+                if _wstate['tileset'] is not None:
+                    oimg = otile.render_overmap_imgtiles(_wstate['tileset'], z=z)
+                else:
+                    oimg = otile.render_overmap_imgtext(opts['font'], fontsize=opts['fontsize'], fpadding=opts['fpadding'],
+                                                        z=z, imagemode=opts['imagemode'])
+                if not oimg.save_image(tmppath, fmt=opts['format'], compress_level=opts.get('compress_level'),
+                                       optimize=opts.get('optimize', False)):
+                    raise IOError("failed to write %s" % (tmppath))
+            os.replace(tmppath, outpath)
+            written += 1
+    except Exception as e:
+        return (omt_x, omt_y, written, str(e))
+    return (omt_x, omt_y, written, None)
+
+def render_segment_job(job):
+    """
+    Render a single segment
+    @returns (seg_x, seg_y, number of outputs written, error message or None)
+    """
+    seg_x, seg_y, seg_z, segpath, seen = job
+    if _wstate.get('error'):
+        return (seg_x, seg_y, 0, _wstate['error'])
+    opts = _wstate['opts']
+    try:
+        outpath = segment_output_path(opts['outdir'], seg_x, seg_y, seg_z, opts['format'])
+        tmppath = outpath + '.tmp'
+        oimg = render_segment(seg_x, seg_y, seg_z, segpath, _wstate['symtab'], opts['font'], fontsize=opts['fontsize'],
+                              fpadding=opts['fpadding'], imagemode=opts['imagemode'], seen=seen)
+        if not oimg.save_image(tmppath, fmt=opts['format'], compress_level=opts.get('compress_level'),
+                               optimize=opts.get('optimize', False)):
+            raise IOError("failed to write %s" % (tmppath))
+        os.replace(tmppath, outpath)
+    except Exception as e:
+        return (seg_x, seg_y, 0, str(e))
+    return (seg_x, seg_y, 1, None)
+
+class Progress(object):
+    """
+    Prints batch progress with throughput and ETA to stderr
+    """
+    total = 0
+    done = 0
+    failed = 0
+    unit = 'overmaps'
+    started = None
+    _tty = False
+
+    def __init__(self, total, unit='overmaps'):
+        self.total = total
+        self.unit = unit
+        self.started = time.time()
+        self._tty = sys.stderr.isatty()
+
+    def update(self, failed=False):
+        """
+        Record one finished job and print progress
+        """
+        self.done += 1
+        if failed:
+            self.failed += 1
+
+        elapsed = time.time() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        msg = "[%d/%d] %.1f%% | %.2f %s/s | ETA %s | %d failed" % (
+            self.done, self.total, 100.0 * self.done / self.total, rate, self.unit,
+            time.strftime('%H:%M:%S', time.gmtime(eta)), self.failed)
+        if self._tty:
+            sys.stderr.write('\r' + msg)
+            if self.done == self.total:
+                sys.stderr.write('\n')
+            sys.stderr.flush()
+        else:
+            logger.info(msg)
+
+def run_batch(jobs, opts, njobs=1, job_func=None, init_func=None, unit='overmaps') -> int:
+    """
+    Render @jobs from plan_jobs() using @njobs worker processes
+
+    @job_func and @init_func default to rendering overmaps; other job types supply
+    their own. @job_func must return (x, y, outputs written, error message or None),
+    and @init_func must return an error message or None without raising.
+    @init_func is run in this process first, so bad options fail before the pool starts.
+    @returns one of the EXIT_* codes
+    """
+    if not jobs:
+        logger.info("nothing to render")
+        return EXIT_OK
+    job_func = job_func or _render_job
+    init_func = init_func or _init_worker
+
+    if init_func(opts) is not None:
+        return EXIT_ERROR
+    os.makedirs(opts['outdir'], exist_ok=True)
+    progress = Progress(len(jobs), unit=unit)
+    failed = 0
+
+    def _handle(result):
+        t_x, t_y, written, err = result
+        if err is not None:
+            logger.error("failed to render %s <%d, %d> (%d outputs written): %s", unit, t_x, t_y, written, err)
+        progress.update(failed=err is not None)
+        return 1 if err is not None else 0
+
+    if njobs <= 1:
+        for job in jobs:
+            failed += _handle(job_func(job))
+    else:
+        with multiprocessing.Pool(njobs, initializer=init_func, initargs=(opts,)) as pool:
+            for result in pool.imap_unordered(job_func, jobs):
+                failed += _handle(result)
+
+    logger.info("rendered %d %s in %.1fs (%d failed)", len(jobs) - failed, unit, time.time() - progress.started, failed)
+    if failed == len(jobs):
+        return EXIT_FAILED
+    if failed:
+        return EXIT_PARTIAL
+    return EXIT_OK
@@ -13,12 +13,26 @@ https://ycnrg.org/
 """
 
 import os
+import re
+import sys
+import signal
 import logging
 import logging.handlers
 from argparse import ArgumentParser
 
+from PIL import Image
+
 from catamap.gamedata import GameData
-from catamap.parse_overmap import World, OvermapTile
+from catamap.parse_overmap import World, read_save_json, decode_cities, unpack_seen, OMT_SZ, SEG_SZ, Z_MIN, Z_MAX
+from catamap.export import export_world, open_world
+from catamap.diff import WorldDiff
+from catamap.batch import plan_jobs, run_batch, init_segment_worker, render_segment_job, RENDER_FORMATS, \
+    EXIT_OK, EXIT_ERROR, EXIT_PARTIAL, EXIT_FAILED
+from catamap.render import OUTPUT_FORMATS, COMPRESS_LEVELS
+from catamap.labels import LabelLayer
+from catamap.snapshot import create_snapshot
+from catamap.visibility import Visibility
+from catamap.parse_submap import list_segments, segment_output_path, SUBMAP_SUBDIRS
 from catamap import __version__, __date__
 
 logger = logging.getLogger('catamap')
@@ -49,14 +63,422 @@ def setup_logging(clevel=logging.INFO, flevel=logging.DEBUG, logfile=None):
 def parse_cli():
     """parse CLI options with argparse"""
     aparser = ArgumentParser(description="Cataclysm DDA map rendering tool")
-    aparser.set_defaults(release=None, update=False, logfile=None, loglevel=logging.INFO)
+    aparser.set_defaults(release=None, update=False, logfile=None, loglevel=logging.INFO, func=None)
 
-    aparser.add_argument("worldname", action="store", nargs="?", metavar="PATH", help="Name of save game world")
     aparser.add_argument("--gamepath", "-p", action="store", metavar="PATH", help="Path to base game directory")
     aparser.add_argument("--debug", "-d", action="store_const", dest="loglevel", const=logging.DEBUG, help="Show debug messages")
     aparser.add_argument("--logfile", "-l", action="store", metavar="LOGPATH", help="Path to output logfile [default: %(default)s]")
     aparser.add_argument("--version", "-V", action="version", version="%s (%s)" % (__version__, __date__))
-    return aparser.parse_args()
+
+    sparser = aparser.add_subparsers(dest="command", metavar="COMMAND")
+
+    p_render = sparser.add_parser("render", help="Render overmap tiles to image files")
+    p_render.set_defaults(func=cmd_render)
+    p_render.add_argument("worldname", action="store", metavar="PATH", help="Name of save game world")
+    p_render.add_argument("--outdir", "-o", action="store", default="render", metavar="OUTDIR", help="Output directory [default: %(default)s]")
+    p_render.add_argument("--format", "-f", action="store", choices=RENDER_FORMATS, default="png", help="Output format [default: %(default)s]")
+    p_render.add_argument("--xrange", "-x", action="store", metavar="X0:X1", help="Range of overmap X coordinates to render [default: all]")
+    p_render.add_argument("--yrange", "-y", action="store", metavar="Y0:Y1", help="Range of overmap Y coordinates to render [default: all]")
+    p_render.add_argument("--zlevels", "-z", action="store", default="0", metavar="Z0:Z1", help="Range of Z-levels to render; use --zlevels=-1:0 for negative values [default: %(default)s]")
+    p_render.add_argument("--font", action="store", metavar="FONTPATH", help="Path to fixed-width font for text rendering")
+    p_render.add_argument("--fontsize", action="store", type=int, default=24, metavar="SIZE", help="Font size [default: %(default)s]")
+    p_render.add_argument("--fpadding", action="store", type=int, default=0, metavar="PX", help="Glyph padding [default: %(default)s]")
+    p_render.add_argument("--tileset", action="store", metavar="TILESETPATH", help="Render with sprites from tileset directory instead of text")
+    p_render.add_argument("--tilesize", action="store", type=int, metavar="PX", help="Tileset tile size [default: tileset size]")
+    p_render.add_argument("--palette", action="store_const", dest="imagemode", const="P", default="RGBA", help="Render text into a fixed-palette image")
+    p_render.add_argument("--compress", action="store", type=int, metavar="LEVEL", help="PNG compression level (0-9) or WebP method (0-6)")
+    p_render.add_argument("--optimize", action="store_true", help="Make an extra encoder pass for smaller output")
+    p_render.add_argument("--jobs", "-j", action="store", type=int, default=1, metavar="N", help="Number of worker processes [default: %(default)s]")
+    p_render.add_argument("--resume", "-r", action="store_true", help="Skip outputs that already exist")
+    p_render.add_argument("--fog", action="store_true", help="Only show OMTs seen by characters in the save")
+    p_render.add_argument("--character", "-c", action="append", metavar="NAME", help="Only use seen data for character NAME (implies --fog; may be repeated)")
+
+    p_svg = sparser.add_parser("svg", help="Render all overmaps at one Z-level into a single SVG file")
+    p_svg.set_defaults(func=cmd_svg)
+    p_svg.add_argument("worldname", action="store", metavar="PATH", help="Name of save game world")
+    p_svg.add_argument("--output", "-o", action="store", metavar="OUTPATH", help="Output file [default: WORLDNAME.Z.svg]")
+    p_svg.add_argument("--zlevel", "-z", action="store", type=int, default=0, choices=range(Z_MIN, Z_MAX + 1), metavar="Z", help="Z-level to render, %d to %d [default: %%(default)s]" % (Z_MIN, Z_MAX))
+    p_svg.add_argument("--fontsize", action="store", type=int, default=24, metavar="SIZE", help="Font size [default: %(default)s]")
+    p_svg.add_argument("--fog", action="store_true", help="Only show OMTs seen by characters in the save")
+    p_svg.add_argument("--character", "-c", action="append", metavar="NAME", help="Only use seen data for character NAME (implies --fog; may be repeated)")
+
+    p_submaps = sparser.add_parser("submaps", help="Render detailed submap terrain, one segment per image")
+    p_submaps.set_defaults(func=cmd_submaps)
+    p_submaps.add_argument("worldname", action="store", metavar="PATH", help="Name of save game world")
+    p_submaps.add_argument("--outdir", "-o", action="store", default="render", metavar="OUTDIR", help="Output directory [default: %(default)s]")
+    p_submaps.add_argument("--format", "-f", action="store", choices=('png', 'webp'), default="png", help="Output format [default: %(default)s]")
+    p_submaps.add_argument("--xrange", "-x", action="store", metavar="X0:X1", help="Range of overmap X coordinates to render [default: all]")
+    p_submaps.add_argument("--yrange", "-y", action="store", metavar="Y0:Y1", help="Range of overmap Y coordinates to render [default: all]")
+    p_submaps.add_argument("--zlevels", "-z", action="store", default="0", metavar="Z0:Z1", help="Range of Z-levels to render; use --zlevels=-1:0 for negative values [default: %(default)s]")
+    p_submaps.add_argument("--font", action="store", required=True, metavar="FONTPATH", help="Path to fixed-width font")
+    p_submaps.add_argument("--fontsize", action="store", type=int, default=12, metavar="SIZE", help="Font size [default: %(default)s]")
+    p_submaps.add_argument("--fpadding", action="store", type=int, default=0, metavar="PX", help="Glyph padding [default: %(default)s]")
+    p_submaps.add_argument("--palette", action="store_const", dest="imagemode", const="P", default="RGBA", help="Render into a fixed-palette image")
+    p_submaps.add_argument("--compress", action="store", type=int, metavar="LEVEL", help="PNG compression level (0-9) or WebP method (0-6)")
+    p_submaps.add_argument("--optimize", action="store_true", help="Make an extra encoder pass for smaller output")
+    p_submaps.add_argument("--jobs", "-j", action="store", type=int, default=1, metavar="N", help="Number of worker processes [default: %(default)s]")
+    p_submaps.add_argument("--resume", "-r", action="store_true", help="Skip outputs that already exist")
+    p_submaps.add_argument("--fog", action="store_true", help="Only show OMTs seen by characters in the save")
+    p_submaps.add_argument("--character", "-c", action="append", metavar="NAME", help="Only use seen data for character NAME (implies --fog; may be repeated)")
+
+    p_labels = sparser.add_parser("labels", help="Composite city labels onto existing Z-level 0 renders")
+    p_labels.set_defaults(func=cmd_labels)
+    p_labels.add_argument("worldname", action="store", metavar="PATH", help="Name of save game world")
+    p_labels.add_argument("--outdir", "-o", action="store", default="render", metavar="OUTDIR", help="Directory of existing renders [default: %(default)s]")
+    p_labels.add_argument("--font", action="store", required=True, metavar="FONTPATH", help="Path to label font")
+    p_labels.add_argument("--fontsize", action="store", type=int, default=16, metavar="SIZE", help="Font size for small cities [default: %(default)s]")
+    p_labels.add_argument("--suffix", action="store", default="labels", help="Suffix for labeled output, eg. o.0.0.0.SUFFIX.png [default: %(default)s]")
+    p_labels.add_argument("--fog", action="store_true", help="Only label cities seen by characters in the save")
+    p_labels.add_argument("--character", "-c", action="append", metavar="NAME", help="Only use seen data for character NAME (implies --fog; may be repeated)")
+
+    p_export = sparser.add_parser("export", help="Export parsed overmaps to a compact binary file")
+    p_export.set_defaults(func=cmd_export)
+    p_export.add_argument("worldname", action="store", metavar="PATH", help="Name of save game world")
+    p_export.add_argument("--output", "-o", action="store", metavar="OUTPATH", help="Output file [default: WORLDNAME.cmap]")
+
+    p_diff = sparser.add_parser("diff", help="Compare overmaps between two snapshots of a world")
+    p_diff.set_defaults(func=cmd_diff)
+    p_diff.add_argument("oldpath", action="store", metavar="OLDPATH", help="Path to old world save directory or export")
+    p_diff.add_argument("newpath", action="store", metavar="NEWPATH", help="Path to new world save directory or export")
+    p_diff.add_argument("--zlevel", "-z", action="store", type=int, default=0, choices=range(Z_MIN, Z_MAX + 1), metavar="Z", help="Z-level to summarize, %d to %d [default: %%(default)s]" % (Z_MIN, Z_MAX))
+    p_diff.add_argument("--overlay", "-o", action="store", metavar="OUTDIR", help="Write change overlay images to OUTDIR")
+
+    args = aparser.parse_args()
+    if args.func is None:
+        aparser.print_help()
+        aparser.exit(1)
+    return args
+
+def cmd_render(args):
+    """
+    Render overmap tiles of a world across a pool of worker processes
+    """
+    savepath = _savepath(args)
+    if savepath is None:
+        return EXIT_ERROR
+    if args.format != 'svg' and not args.font and not args.tileset:
+        logger.error("one of --font or --tileset is required for %s output", args.format)
+        return EXIT_ERROR
+    if args.tileset and not os.path.isfile(os.path.join(args.tileset, 'tile_config.json')):
+        logger.error("no tile_config.json found in tileset directory %s", args.tileset)
+        return EXIT_ERROR
+
+    try:
+        xrange = _parse_range(args.xrange) if args.xrange else None
+        yrange = _parse_range(args.yrange) if args.yrange else None
+        z_min, z_max = _parse_range(args.zlevels, limits=(Z_MIN, Z_MAX))
+    except ValueError as e:
+        logger.error("invalid range: %s", str(e))
+        return EXIT_ERROR
+    if args.compress is not None and args.format in COMPRESS_LEVELS and \
+       not COMPRESS_LEVELS[args.format][0] <= args.compress <= COMPRESS_LEVELS[args.format][1]:
+        logger.error("--compress must be %d-%d for %s output", *COMPRESS_LEVELS[args.format], args.format)
+        return EXIT_ERROR
+
+    # only the overmap index is needed here; game data is resolved once below and shared with workers
+    world = World(savepath, None)
+    if not world.tindex:
+        logger.error("no overmaps found in %s", savepath)
+        return EXIT_ERROR
+
+    visibility = _visibility(args, savepath)
+    if visibility is False:
+        return EXIT_ERROR
+    jobs, skipped = plan_jobs(world, args.outdir, args.format, xrange=xrange, yrange=yrange,
+                              zlevels=range(z_min, z_max + 1), resume=args.resume, visibility=visibility)
+    logger.info("%d overmaps to render, %d already complete", len(jobs), skipped)
+
+    opts = {
+        'gamepath': args.gamepath,
+        'outdir': args.outdir,
+        'format': args.format,
+        'font': args.font,
+        'fontsize': args.fontsize,
+        'fpadding': args.fpadding,
+        'tileset': args.tileset,
+        'tilesize': args.tilesize,
+        'imagemode': args.imagemode,
+        'compress_level': args.compress,
+        'optimize': args.optimize,
+    }
+    if not jobs:
+        return run_batch(jobs, opts, njobs=args.jobs)
+    return _run_with_snapshot(GameData(args.gamepath), jobs, opts, njobs=args.jobs)
+
+def cmd_svg(args):
+    """
+    Render all overmaps of a world at one Z-level into a single scalable SVG
+    """
+    savepath = _savepath(args)
+    if savepath is None:
+        return EXIT_ERROR
+    visibility = _visibility(args, savepath)
+    if visibility is False:
+        return EXIT_ERROR
+
+    # overmaps are streamed one row at a time, so keep only the most recent one loaded
+    world = World(savepath, GameData(args.gamepath), mem_budget=0, visibility=visibility)
+    if not world.tindex:
+        logger.error("no overmaps found in %s", savepath)
+        return EXIT_ERROR
+    outpath = args.output or ('%s.%d.svg' % (os.path.basename(os.path.normpath(args.worldname)), args.zlevel))
+    tmppath = outpath + '.tmp'
+    try:
+        if not world.render_svg(tmppath, fontsize=args.fontsize, z=args.zlevel):
+            return EXIT_ERROR
+        os.replace(tmppath, outpath)
+        logger.info("wrote world SVG to %s", outpath)
+    except Exception as e:
+        logger.error("failed to render world '%s': %s", args.worldname, str(e))
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        return EXIT_ERROR
+    if world.stats['failed']:
+        logger.warning("%d overmaps failed to load and were left empty", world.stats['failed'])
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+def cmd_submaps(args):
+    """
+    Render detailed submap terrain of a world, one segment per worker job
+    """
+    savepath = _savepath(args)
+    if savepath is None:
+        return EXIT_ERROR
+
+    try:
+        xrange = _parse_range(args.xrange) if args.xrange else None
+        yrange = _parse_range(args.yrange) if args.yrange else None
+        z_min, z_max = _parse_range(args.zlevels, limits=(Z_MIN, Z_MAX))
+    except ValueError as e:
+        logger.error("invalid range: %s", str(e))
+        return EXIT_ERROR
+    if args.compress is not None and args.format in COMPRESS_LEVELS and \
+       not COMPRESS_LEVELS[args.format][0] <= args.compress <= COMPRESS_LEVELS[args.format][1]:
+        logger.error("--compress must be %d-%d for %s output", *COMPRESS_LEVELS[args.format], args.format)
+        return EXIT_ERROR
+
+    segs = list_segments(World(savepath, None), xrange=xrange, yrange=yrange, zlevels=range(z_min, z_max + 1))
+    if not segs:
+        logger.error("no submap segments found in %s", savepath)
+        return EXIT_ERROR
+    jobs = []
+    unseen = 0
+    visibility = _visibility(args, savepath)
+    if visibility is False:
+        return EXIT_ERROR
+    for seg_x, seg_y, seg_z, segpath in segs:
+        if args.resume and os.path.exists(segment_output_path(args.outdir, seg_x, seg_y, seg_z, args.format)):
+            continue
+        seen = None
+        if visibility is not None:
+            # fully unseen segments are never rendered
+            seen = visibility.get_segment_seen(seg_x, seg_y, seg_z)
+            if not seen.any():
+                unseen += 1
+                continue
+        jobs.append((seg_x, seg_y, seg_z, segpath, seen))
+    logger.info("%d segments to render, %d already complete, %d never seen",
+                len(jobs), len(segs) - len(jobs) - unseen, unseen)
+    if not jobs:
+        return EXIT_OK
+
+    # resolve symbols once here, rather than in each worker
+    opts = {
+        'outdir': args.outdir,
+        'format': args.format,
+        'font': args.font,
+        'fontsize': args.fontsize,
+        'fpadding': args.fpadding,
+        'imagemode': args.imagemode,
+        'compress_level': args.compress,
+        'optimize': args.optimize,
+    }
+    return _run_with_snapshot(GameData(args.gamepath, subdirs=SUBMAP_SUBDIRS), jobs, opts, njobs=args.jobs,
+                              job_func=render_segment_job, init_func=init_segment_worker, unit='segments')
+
+def cmd_labels(args):
+    """
+    Composite city labels onto existing overmap and segment renders
+    """
+    savepath = _savepath(args)
+    if savepath is None:
+        return EXIT_ERROR
+
+    r_out = re.compile(r'^(?P<kind>[os])\.(?P<x>-?[0-9]+)\.(?P<y>-?[0-9]+)\.0\.(?P<ext>png|webp)$')
+    try:
+        outputs = [(x, r_out.match(x.name)) for x in os.scandir(args.outdir) if r_out.match(x.name)]
+    except OSError as e:
+        logger.error("failed to read render directory %s: %s", args.outdir, str(e))
+        return EXIT_ERROR
+    if not outputs:
+        logger.error("no Z-level 0 renders found in %s", args.outdir)
+        return EXIT_ERROR
+
+    # cities are read from every overmap, so labels near overmap edges are placed consistently
+    world = World(savepath, None)
+    if not world.tindex:
+        logger.error("no overmaps found in %s", savepath)
+        return EXIT_ERROR
+    visibility = _visibility(args, savepath)
+    if visibility is False:
+        return EXIT_ERROR
+    layer = LabelLayer(args.font, fontsize=args.fontsize)
+    for omt_x, omt_y in world.list_tiles():
+        if visibility is not None and visibility.is_unseen(omt_x, omt_y, [0]):
+            continue
+        try:
+            cities = decode_cities(read_save_json(world.tindex[(omt_x, omt_y)]))
+        except Exception as e:
+            logger.warning("failed to read cities for overmap <%d, %d>: %s", omt_x, omt_y, str(e))
+            continue
+        seen = unpack_seen(visibility.get_seen(omt_x, omt_y), 0) if visibility is not None else None
+        layer.add_cities(omt_x, omt_y, cities, seen=seen)
+    logger.info("loaded %d city labels", len(layer.labels))
+
+    failed = 0
+    for tfile, tmatch in outputs:
+        # OMT cell size is recovered from the image size; glyph padding is always smaller than a cell
+        span = OMT_SZ if tmatch.group('kind') == 'o' else SEG_SZ
+        t_x = int(tmatch.group('x')) * span
+        t_y = int(tmatch.group('y')) * span
+        outpath = os.path.join(args.outdir, '%s.%s.%s' % (tfile.name.rsplit('.', 1)[0], args.suffix, tmatch.group('ext')))
+        try:
+            with Image.open(tfile.path) as im:
+                cell_w = -(-im.size[0] // span)
+                cell_h = -(-im.size[1] // span)
+                oim = layer.composite(im, t_x, t_y, cell_w, cell_h)
+            oim.save(outpath + '.tmp', format=OUTPUT_FORMATS[tmatch.group('ext')]['format'])
+            os.replace(outpath + '.tmp', outpath)
+        except Exception as e:
+            logger.error("failed to label %s: %s", tfile.path, str(e))
+            failed += 1
+
+    logger.info("labeled %d renders (%d failed)", len(outputs) - failed, failed)
+    if failed == len(outputs):
+        return EXIT_FAILED
+    return EXIT_PARTIAL if failed else EXIT_OK
+
+def cmd_export(args):
+    """
+    Export parsed overmaps of a world to a compact binary file
+    """
+    savepath = _savepath(args)
+    if savepath is None:
+        return EXIT_ERROR
+    outpath = args.output or (os.path.basename(os.path.normpath(args.worldname)) + '.cmap')
+    # raw omtype ids are exported, so game data is not needed
+    world = World(savepath, None)
+    try:
+        count = export_world(world, outpath)
+    except Exception as e:
+        logger.error("failed to export world '%s': %s", args.worldname, str(e))
+        return EXIT_ERROR
+    if not count:
+        logger.error("no overmaps exported from %s", savepath)
+        return EXIT_ERROR
+    if count < len(world.tindex):
+        logger.warning("%d unreadable overmaps were skipped", len(world.tindex) - count)
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+def cmd_diff(args):
+    """
+    Compare overmaps between two snapshots of a world
+    """
+    try:
+        wdiff = WorldDiff(_open_world(args.oldpath), _open_world(args.newpath))
+    except Exception as e:
+        logger.error("failed to compare worlds: %s", str(e))
+        return 1
+
+    for coord in wdiff.added:
+        print("<%d, %d>: added" % coord)
+    for coord in wdiff.removed:
+        print("<%d, %d>: removed" % coord)
+    for coord, tdiff in sorted(wdiff.diffs.items()):
+        print("<%d, %d>: %d changed (%d at z=%d)" % (*coord, tdiff.total(), tdiff.counts[args.zlevel], args.zlevel))
+        for (old_type, new_type), tcount in tdiff.transitions(args.zlevel, limit=5):
+            print("    %s -> %s: %d" % (old_type, new_type, tcount))
+        if args.overlay:
+            os.makedirs(args.overlay, exist_ok=True)
+            tdiff.render_overlay(args.zlevel).save(os.path.join(args.overlay, 'diff.%d.%d.%d.png' % (*coord, args.zlevel)))
+    return 0
+
+def _run_with_snapshot(gdata, jobs, opts, **kwargs):
+    """
+    Publish a snapshot of @gdata for workers to attach to, then run_batch()
+    The snapshot is removed once all workers are finished, or if this process is sent SIGTERM
+    """
+    ppid = os.getpid()
+
+    def _sigterm(signum, frame):
+        # pool workers inherit this handler, but only the parent owns the snapshot
+        if os.getpid() != ppid:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+            return
+        raise SystemExit(128 + signum)
+
+    oldterm = signal.signal(signal.SIGTERM, _sigterm)
+    try:
+        try:
+            opts['snapshot'] = create_snapshot(gdata)
+        except Exception as e:
+            logger.error("failed to create game data snapshot: %s", str(e))
+            return EXIT_ERROR
+        try:
+            return run_batch(jobs, opts, **kwargs)
+        finally:
+            os.unlink(opts['snapshot'])
+    finally:
+        signal.signal(signal.SIGTERM, oldterm)
+
+def _savepath(args):
+    """
+    Returns save directory for world @args.worldname, or None if --gamepath is missing
+    """
+    if not args.gamepath:
+        logger.error("--gamepath is required")
+        return None
+    return os.path.join(args.gamepath, 'save', args.worldname)
+
+def _visibility(args, savepath):
+    """
+    Returns Visibility for characters in save directory if --fog or --character is set, or None
+    Returns False if any --character has no seen data, so a typo doesn't silently render nothing
+    """
+    if not args.fog and not args.character:
+        return None
+    visibility = Visibility(savepath, characters=args.character)
+    if visibility.unmatched:
+        logger.error("no seen data found for character(s): %s", ', '.join(visibility.unmatched))
+        return False
+    if not visibility.characters:
+        logger.warning("no seen data found in %s; everything will be unexplored", savepath)
+    return visibility
+
+def _parse_range(rstr, limits=None):
+    """
+    Parse inclusive range 'A:B' or single value 'A' into (A, B)
+    If @limits is set, both ends must lie within the inclusive (min, max) tuple
+    """
+    rmin, _, rmax = rstr.partition(':')
+    rmin = int(rmin)
+    rmax = int(rmax) if rmax else rmin
+    if rmax < rmin:
+        raise ValueError("'%s' ends before it starts" % (rstr))
+    if limits and not limits[0] <= rmin <= rmax <= limits[1]:
+        raise ValueError("'%s' is outside of %d:%d" % (rstr, *limits))
+    return (rmin, rmax)
+
+def _open_world(path):
+    """
+    Open a World from a save directory or export file, without game data
+    """
+    if os.path.isfile(path):
+        return open_world(path, None)
+    return World(path, None)
 
 def _main():
     """
@@ -64,20 +486,7 @@ def _main():
     """
     args = parse_cli()
     setup_logging(args.loglevel, flevel=args.loglevel, logfile=args.logfile)
-
-    # XXX-TESTING ##
-    savepath = os.path.join(args.gamepath, 'save', args.worldname)
-    gdata = GameData(args.gamepath)
-    otile = OvermapTile(0, 0, '/opt/CataclysmDDA/tiles/userdata.debug/save/OMTest/o.0.0')
-    otile.resolve_symbols(gdata)
-    print(otile.render_overmap_ansi())
-    #oimg = otile.render_overmap_imgtext('/home/jacob/jfonts/fonts/ofl/inconsolata/Inconsolata-Regular.ttf', fontsize=24)
-    #oimg = otile.render_overmap_imgtext('/opt/CataclysmDDA/tiles/cataclysmdda-0.D-9579/data/font/unifont.ttf', fontsize=24)
-    #oimg = otile.render_overmap_imgtext('/home/jacob/jfonts/consola.ttf', fontsize=24, fpadding=4)
-    oimg = otile.render_overmap_imgtext('/home/jacob/jfonts/fira/Fira_Mono_3_2/Fonts/FiraMono_OTF_32/FiraMono-Regular.otf', fontsize=24, fpadding=0)
-    oimg.save_image('oimg.png')
-    #World(savepath, gdata)
-    ###
+    sys.exit(args.func(args))
 
 if __name__ == '__main__':
     _main()
@@ -43,6 +43,15 @@ COLORS = {
     'pink': (13, (255, 0, 255)),
 }
 
+# Alternate color names, mapped to COLORS keys
+COLOR_ALIASES = {
+    'gray': 'light_gray',
+    'grey': 'light_gray',
+}
+
+PALETTE = list(COLORS)      # Palette index -> color name, for 'P' mode images
+PALETTE_INDEX = {COLORS[x][1]: i for i, x in enumerate(PALETTE)}
+
 
 def translate_color(cstr: str, cspace='ansi') -> ColorPair:
     """
@@ -60,6 +69,9 @@ def translate_color(cstr: str, cspace='ansi') -> ColorPair:
         logger.error("failed to translate color '%s': %s", cstr, str(e))
         return None
 
+    s_fg = COLOR_ALIASES.get(s_fg, s_fg)
+    s_bg = COLOR_ALIASES.get(s_bg, s_bg)
+
     if s_fg == 'unset':
         logger.debug("c_unset, returning None")
         return None
@@ -92,6 +104,24 @@ def translate_color(cstr: str, cspace='ansi') -> ColorPair:
 
     return (fg, bg)
 
+def get_palette() -> list:
+    """
+    Returns a flat [r, g, b, r, g, b, ...] palette of all COLORS,
+    in PALETTE order, suitable for Image.putpalette()
+    """
+    return [c for x in PALETTE for c in COLORS[x][1]]
+
+def palette_index(rgb, default='white') -> int:
+    """
+    Translate (r,g,b) or (r,g,b,a) tuple @rgb to its PALETTE index
+    Colors not in COLORS are mapped to @default
+    """
+    try:
+        return PALETTE_INDEX[tuple(rgb[:3])]
+    except (KeyError, TypeError):
+        logger.debug("color %s not in palette, using %s", str(rgb), default)
+        return PALETTE_INDEX[COLORS[default][1]]
+
 def colorize_ansi(instr: str, catacolor: str) -> str:
     """
     Colorize @instr using Cataclysm color string @catacolor
@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+"""
+
+catamap.diff
+Compare overmap layers between two saves of the same world
+
+License: GPLv3
+Repo: <https://git.ycnrg.org/projects/GTOOL/repos/catamap>
+
+Copyright (c) 2019 J. Hipps <jacob@ycnrg.org>
+https://ycnrg.org/
+
+"""
+
+import filecmp
+import logging
+
+import numpy as np
+from PIL import Image
+
+from catamap.parse_overmap import World, OMT_SZ, Z_MIN, Z_MAX, NO_TERRAIN
+from catamap import __version__, __date__
+
+logger = logging.getLogger('catamap')
+
+DIFF_COLOR = (255, 0, 255, 160)     # RGBA highlight color for changed OMTs
+
+
+class OvermapDiff(object):
+    """
+    Differences between the terrain layers of a single overmap in two worlds
+    """
+    x = None
+    y = None
+    terrain = None          # list of omtype strings, shared by @old and @new
+    old = None              # uint16 terrain ids before, shape (Z_LEVELS, OMT_SZ, OMT_SZ)
+    new = None              # uint16 terrain ids after
+    mask = None             # bool array of changed OMTs, same shape as @old and @new
+    counts = None           # dict of z -> number of changed OMTs
+
+    def __init__(self, x, y, old_layers, new_layers):
+        self.x = x
+        self.y = y
+        self._compare(old_layers, new_layers)
+
+    def _compare(self, old_layers, new_layers):
+        """
+        Map both layers into a shared terrain table, then compare them
+        @old_layers and @new_layers are (terrain, layers) tuples from World.get_layers()
+        """
+        self.terrain = []
+        tids = {}
+        remaps = []
+        for lterrain, _ in (old_layers, new_layers):
+            remap = np.full(NO_TERRAIN + 1, NO_TERRAIN, dtype=np.uint16)
+            for lid, ttype in enumerate(lterrain):
+                if ttype not in tids:
+                    tids[ttype] = len(self.terrain)
+                    self.terrain.append(ttype)
+                remap[lid] = tids[ttype]
+            remaps.append(remap)
+
+        self.old = remaps[0][old_layers[1]]
+        self.new = remaps[1][new_layers[1]]
+        self.mask = self.old != self.new
+        zcounts = self.mask.sum(axis=(1, 2))
+        self.counts = {tz: int(zcounts[tz - Z_MIN]) for tz in range(Z_MIN, Z_MAX + 1)}
+
+    def total(self) -> int:
+        """
+        Returns total number of changed OMTs across all Z-levels
+        """
+        return sum(self.counts.values())
+
+    def transitions(self, z=0, limit=None):
+        """
+        Returns a list of ((old omtype, new omtype), count) for Z-level @z,
+        most frequent first, eg. (('field', 'road_ns'), 12)
+        """
+        zdex = z - Z_MIN
+        zmask = self.mask[zdex]
+        if not zmask.any():
+            return []
+
+        # pack old & new ids into a single key, so transitions can be counted in one pass
+        tkeys = (self.old[zdex][zmask].astype(np.uint32) << 16) | self.new[zdex][zmask]
+        ukeys, ucounts = np.unique(tkeys, return_counts=True)
+        tlist = []
+        for tkey, tcount in zip(ukeys.tolist(), ucounts.tolist()):
+            tlist.append(((self._omtype(tkey >> 16), self._omtype(tkey & 0xFFFF)), tcount))
+        tlist.sort(key=lambda x: x[1], reverse=True)
+        return tlist[:limit] if limit else tlist
+
+    def _omtype(self, tid):
+        return None if tid == NO_TERRAIN else self.terrain[tid]
+
+    def render_overlay(self, z=0, base=None, color=DIFF_COLOR):
+        """
+        Returns an RGBA PIL Image highlighting changed OMTs at Z-level @z
+
+        Without @base, the image is OMT_SZ x OMT_SZ with one pixel per OMT and unchanged
+        OMTs left transparent. When @base is an OvermapTileImage, the highlights are
+        scaled to its glyph cells and composited over a copy of its image.
+        """
+        overlay = np.zeros((OMT_SZ, OMT_SZ, 4), dtype=np.uint8)
+        overlay[self.mask[z - Z_MIN]] = color
+        oimg = Image.fromarray(overlay, 'RGBA')
+        if base is None:
+            return oimg
+
+        cell_w = base.f_w + base.fpadding
+        cell_h = base.f_h + base.fpadding
+        oimg = oimg.resize((cell_w * OMT_SZ, cell_h * OMT_SZ), Image.NEAREST).crop((0, 0, base.i_w, base.i_h))
+        return Image.alpha_composite(base.im.convert('RGBA'), oimg)
+
+class WorldDiff(object):
+    """
+    Compares the overmap layers of two World instances
+    Overmaps whose save files are byte-identical are skipped without being parsed;
+    for exports, overmaps whose grids are equal are skipped before building an OvermapDiff
+    """
+    old = None              # World before
+    new = None              # World after
+    added = None            # list of (x, y) overmaps only in @new
+    removed = None          # list of (x, y) overmaps only in @old
+    unchanged = None        # list of (x, y) overmaps with identical files or layers
+    diffs = None            # dict of (x, y) -> OvermapDiff for changed overmaps
+    _export_remap = None    # old -> new terrain id table, when both worlds are exports
+
+    def __init__(self, old: World, new: World):
+        self.old = old
+        self.new = new
+        self.added = []
+        self.removed = []
+        self.unchanged = []
+        self.diffs = {}
+        self.compare()
+
+    def compare(self):
+        """
+        Compare all overmaps present in either world
+        """
+        old_tiles = set(self.old.list_tiles())
+        new_tiles = set(self.new.list_tiles())
+        self.added = sorted(new_tiles - old_tiles)
+        self.removed = sorted(old_tiles - new_tiles)
+
+        for coord in sorted(old_tiles & new_tiles):
+            if self._files_identical(coord):
+                logger.debug("overmap tile at <%d, %d> is identical, skipping", *coord)
+                self.unchanged.append(coord)
+                continue
+
+            old_layers = self.old.get_layers(*coord)
+            new_layers = self.new.get_layers(*coord)
+            if old_layers is None or new_layers is None:
+                logger.warning("failed to compare overmap tile at <%d, %d>", *coord)
+                continue
+            if (self.old.export is not None or self.new.export is not None) and \
+               self._layers_identical(old_layers, new_layers):
+                logger.debug("overmap tile at <%d, %d> is identical, skipping", *coord)
+                self.unchanged.append(coord)
+                continue
+
+            tdiff = OvermapDiff(*coord, old_layers, new_layers)
+            if tdiff.total():
+                logger.debug("overmap tile at <%d, %d> has %d changes", *coord, tdiff.total())
+                self.diffs[coord] = tdiff
+            else:
+                self.unchanged.append(coord)
+
+        logger.info("compared %d overmaps: %d changed, %d unchanged, %d added, %d removed",
+                    len(old_tiles & new_tiles), len(self.diffs), len(self.unchanged),
+                    len(self.added), len(self.removed))
+        return True
+
+    def _files_identical(self, coord) -> bool:
+        """
+        Returns True if both overmap save files are byte-identical
+        """
+        if self.old.export is not None or self.new.export is not None:
+            return False
+        try:
+            return filecmp.cmp(self.old.tindex[coord], self.new.tindex[coord], shallow=False)
+        except OSError as e:
+            logger.debug("failed to compare files for <%d, %d>: %s", *coord, str(e))
+            return False
+
+    def _layers_identical(self, old_layers, new_layers) -> bool:
+        """
+        Returns True if @old_layers and @new_layers, (terrain, layers) tuples from World.get_layers(),
+        have the same omtype at every OMT. Exports have no save files to compare, so this replaces
+        _files_identical() for them; the terrain remap is built once when both worlds are exports.
+        """
+        remap = self._export_remap
+        if remap is None:
+            old_terrain, new_terrain = old_layers[0], new_layers[0]
+            tids = {ttype: tid for tid, ttype in enumerate(new_terrain)}
+            # omtypes missing from @new_terrain map past NO_TERRAIN, so they never compare equal
+            remap = np.full(NO_TERRAIN + 1, NO_TERRAIN, dtype=np.uint32)
+            remap[:len(old_terrain)] = [tids.get(x, NO_TERRAIN + 1) for x in old_terrain]
+            if self.old.export is not None and self.new.export is not None:
+                self._export_remap = remap
+        return np.array_equal(remap[old_layers[1]], new_layers[1])
+
+    def counts(self, z=None):
+        """
+        Returns a dict of (x, y) -> number of changed OMTs, for Z-level @z or all Z-levels
+        """
+        if z is None:
+            return {coord: tdiff.total() for coord, tdiff in self.diffs.items()}
+        return {coord: tdiff.counts[z] for coord, tdiff in self.diffs.items() if tdiff.counts[z]}
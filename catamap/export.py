@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+"""
+
+catamap.export
+Binary export format for parsed worlds
+
+License: GPLv3
+Repo: <https://git.ycnrg.org/projects/GTOOL/repos/catamap>
+
+Copyright (c) 2019 J. Hipps <jacob@ycnrg.org>
+https://ycnrg.org/
+
+
+Export file layout (all values little-endian):
+
+[header]    - EXP_HEADER, padded to EXP_ALIGN bytes
+[grids]     - One uint16 grid per overmap, shape (Z_LEVELS, OMT_SZ, OMT_SZ), each aligned to EXP_ALIGN
+[index]     - One EXP_INDEX entry (x, y, offset) per overmap
+[strtab]    - Terrain string table; uint16 length followed by UTF-8 omtype string
+
+Grid values are indexes into the terrain string table, or NO_TERRAIN.
+
+"""
+
+import os
+import mmap
+import struct
+import logging
+
+import numpy as np
+
+from catamap.gamedata import GameData
+from catamap.parse_overmap import World, read_overmap_layers, OMT_SZ, Z_MIN, Z_LEVELS, NO_TERRAIN
+from catamap import __version__, __date__
+
+logger = logging.getLogger('catamap')
+
+EXP_MAGIC = b'CMAP'
+EXP_VERSION = 1
+EXP_ALIGN = 4096
+EXP_HEADER = struct.Struct('<4sHHIIhHQQ')   # magic, version, z_levels, n_terrain, n_overmaps, z_min, omt_sz, index_off, strtab_off
+EXP_INDEX = struct.Struct('<iiQ')           # x, y, grid offset
+EXP_STRLEN = struct.Struct('<H')
+
+
+class ExportError(Exception):
+    """
+    Raised when an export file cannot be written or read
+    """
+    pass
+
+class OvermapExport(object):
+    """
+    Memory-mapped, read-only view of an exported world
+    Grids returned by get_layers() reference the mapped file directly, without copying
+    """
+    path = None
+    terrain = None          # list of omtype strings, indexed by terrain id
+    tindex = None           # dict of (x, y) -> grid offset
+    z_min = Z_MIN
+    z_levels = Z_LEVELS
+    omt_sz = OMT_SZ
+    _fd = None
+    _mm = None
+
+    def __init__(self, path):
+        self.path = os.path.realpath(os.path.expanduser(path))
+        self.tindex = {}
+        self.terrain = []
+        self._open()
+
+    def _open(self):
+        """
+        Map export file and read header, index and string table
+        The file is closed again if it cannot be read
+        """
+        self._fd = open(self.path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+            n_overmaps, n_terrain = self._read_index()
+        except Exception as e:
+            self.close()
+            if isinstance(e, ExportError):
+                raise
+            raise ExportError("failed to read export file '%s': %s" % (self.path, str(e)))
+
+        logger.debug("opened export %s (%d overmaps, %d terrain types)", self.path, n_overmaps, n_terrain)
+
+    def _read_index(self):
+        """
+        Read header, index and string table, checking all offsets against the file length
+        @returns (n_overmaps, n_terrain)
+        """
+        fsize = len(self._mm)
+        if fsize < EXP_HEADER.size:
+            raise ExportError("export '%s' is truncated" % (self.path))
+
+        magic, version, self.z_levels, n_terrain, n_overmaps, self.z_min, self.omt_sz, \
+            index_off, strtab_off = EXP_HEADER.unpack_from(self._mm, 0)
+        if magic != EXP_MAGIC:
+            raise ExportError("'%s' is not a catamap export file" % (self.path))
+        if version != EXP_VERSION:
+            raise ExportError("unsupported export version %d in '%s'" % (version, self.path))
+        if (self.z_min, self.z_levels, self.omt_sz) != (Z_MIN, Z_LEVELS, OMT_SZ):
+            raise ExportError("export '%s' has incompatible dimensions" % (self.path))
+        if index_off + (n_overmaps * EXP_INDEX.size) > strtab_off or strtab_off > fsize:
+            raise ExportError("export '%s' is truncated" % (self.path))
+
+        gsize = self.z_levels * self.omt_sz * self.omt_sz * 2
+        for i in range(n_overmaps):
+            omt_x, omt_y, goff = EXP_INDEX.unpack_from(self._mm, index_off + (i * EXP_INDEX.size))
+            if goff + gsize > index_off:
+                raise ExportError("export '%s' has an invalid grid offset for overmap <%d, %d>" % (self.path, omt_x, omt_y))
+            self.tindex[(omt_x, omt_y)] = goff
+
+        toff = strtab_off
+        for i in range(n_terrain):
+            if toff + EXP_STRLEN.size > fsize:
+                raise ExportError("export '%s' is truncated" % (self.path))
+            tlen, = EXP_STRLEN.unpack_from(self._mm, toff)
+            toff += EXP_STRLEN.size
+            if toff + tlen > fsize:
+                raise ExportError("export '%s' is truncated" % (self.path))
+            self.terrain.append(self._mm[toff:toff + tlen].decode('utf-8'))
+            toff += tlen
+        return (n_overmaps, n_terrain)
+
+    def list_tiles(self):
+        """
+        Returns a sorted list of (x, y) coordinates of all exported overmap tiles
+        """
+        return sorted(self.tindex)
+
+    def get_layers(self, x, y):
+        """
+        Returns a read-only uint16 array view of terrain ids for overmap at x,y,
+        with shape (Z_LEVELS, OMT_SZ, OMT_SZ), or None if not exported
+        """
+        goff = self.tindex.get((x, y))
+        if goff is None:
+            logger.debug("no exported overmap tile at <%d, %d>", x, y)
+            return None
+        return np.frombuffer(self._mm, dtype='<u2', count=self.z_levels * self.omt_sz * self.omt_sz,
+                             offset=goff).reshape((self.z_levels, self.omt_sz, self.omt_sz))
+
+    def close(self):
+        """
+        Unmap export file
+        Any arrays previously returned by get_layers() must no longer be in use
+        """
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+def pad_to(f, align=EXP_ALIGN):
+    """
+    Pad file @f with zeroes up to the next multiple of @align
+    @returns New file position
+    """
+    tpos = f.tell()
+    if tpos % align:
+        f.write(b'\0' * (align - (tpos % align)))
+    return f.tell()
+
+def export_world(world: World, outpath) -> int:
+    """
+    Export all overmaps from @world to binary file @outpath
+    Overmap JSON is read one file at a time, so @world is never fully loaded
+    Nothing is written to @outpath if no overmaps could be exported
+    @returns Number of overmaps exported
+    """
+    if world.export is not None:
+        raise ExportError("world '%s' is already an export" % (world.path))
+
+    terrain = []
+    tids = {}
+    tindex = []
+    tmppath = outpath + '.tmp'
+
+    try:
+        with open(tmppath, 'wb') as f:
+            f.write(b'\0' * EXP_HEADER.size)
+            pad_to(f)
+
+            for omt_x, omt_y in world.list_tiles():
+                try:
+                    lterrain, layers = read_overmap_layers(world.tindex[(omt_x, omt_y)])
+                except Exception as e:
+                    logger.error("failed to read overmap tile at <%d, %d>: %s", omt_x, omt_y, str(e))
+                    continue
+
+                # remap per-overmap terrain ids into the global string table
+                remap = np.full(NO_TERRAIN + 1, NO_TERRAIN, dtype='<u2')
+                for lid, ttype in enumerate(lterrain):
+                    if ttype not in tids:
+                        if len(terrain) >= NO_TERRAIN:
+                            raise ExportError("too many terrain types for export (max %d)" % (NO_TERRAIN))
+                        tids[ttype] = len(terrain)
+                        terrain.append(ttype)
+                    remap[lid] = tids[ttype]
+
+                tindex.append((omt_x, omt_y, f.tell()))
+                f.write(remap[layers].tobytes())
+                pad_to(f)
+                logger.debug("exported overmap tile at <%d, %d>", omt_x, omt_y)
+
+            index_off = f.tell()
+            for tentry in tindex:
+                f.write(EXP_INDEX.pack(*tentry))
+
+            strtab_off = f.tell()
+            for ttype in terrain:
+                tbytes = ttype.encode('utf-8')
+                f.write(EXP_STRLEN.pack(len(tbytes)))
+                f.write(tbytes)
+
+            f.seek(0)
+            f.write(EXP_HEADER.pack(EXP_MAGIC, EXP_VERSION, Z_LEVELS, len(terrain), len(tindex),
+                                    Z_MIN, OMT_SZ, index_off, strtab_off))
+    except Exception:
+        # don't leave a partial export behind
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        raise
+
+    if not tindex:
+        os.unlink(tmppath)
+        return 0
+    os.replace(tmppath, outpath)
+    logger.info("exported %d overmaps (%d terrain types) to %s", len(tindex), len(terrain), outpath)
+    return len(tindex)
+
+def open_world(path, gamedata: GameData, mem_budget=None) -> World:
+    """
+    Open a World from export file @path
+    Overmaps are still loaded lazily by World.get_tile(), but read from the mapped export instead of JSON
+    """
+    return World(path, gamedata, mem_budget=mem_budget, export=OvermapExport(path))
@@ -12,6 +12,7 @@ https://ycnrg.org/
 
 
 [data/json]/overmap - Overmap tile data
+[data/json]/furniture_and_terrain - Terrain & furniture data (submap rendering only)
 
 
 """
@@ -24,6 +25,8 @@ from catamap import __version__, __date__
 
 logger = logging.getLogger('catamap')
 
+C_SUBDIRS = ['mapgen', 'overmap']     # data/json subdirectories loaded by default
+
 C_TYPEMAP = {
     'mapgen': list,
     'monstergroup': list,
@@ -38,15 +41,15 @@ class GameData(object):
     _gamedir = None
     _data = {}
 
-    def __init__(self, gamedir):
+    def __init__(self, gamedir, subdirs=None):
         if os.path.basename(os.path.realpath(gamedir)) == 'json':
             self._gamedir = os.path.expanduser(gamedir)
         else:
             self._gamedir = os.path.expanduser(os.path.join(gamedir, 'data', 'json'))
 
         # load relavent all gamedata
-        self._recurse_load_dir('mapgen')
-        self._recurse_load_dir('overmap')
+        for tsub in (subdirs or C_SUBDIRS):
+            self._recurse_load_dir(tsub)
 
         self._resolve_deps()
 
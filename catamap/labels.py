@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+"""
+
+catamap.labels
+City label overlay for rendered overmaps
+
+License: GPLv3
+Repo: <https://git.ycnrg.org/projects/GTOOL/repos/catamap>
+
+Copyright (c) 2019 J. Hipps <jacob@ycnrg.org>
+https://ycnrg.org/
+
+Labels are placed once in world pixel coordinates for a given cell size, then
+composited onto any image covering part of the world (an overmap render, a
+submap segment, or a scaled copy of either), so the base map is never re-rendered.
+
+"""
+
+import logging
+
+from PIL import Image, ImageDraw, ImageFont
+
+from catamap.parse_overmap import OMT_SZ
+from catamap import __version__, __date__
+
+logger = logging.getLogger('catamap')
+
+# (minimum city size, font scale), largest first
+LABEL_TIERS = ((8, 1.5), (4, 1.25), (0, 1.0))
+LABEL_FG = (255, 255, 255, 255)
+LABEL_OUTLINE = (0, 0, 0, 255)
+LABEL_BUCKET = 256      # Spatial hash bucket size (px) for collision checks
+
+# rasterized label cache, shared by all LabelLayers
+_label_fonts = {}       # (fontpath, size) -> ImageFont
+_label_sprites = {}     # (fontpath, size, text) -> Image
+
+
+def get_label_sprite(fontpath, size, text):
+    """
+    Returns an RGBA Image of @text rendered with an outline, cached per font and size
+    """
+    sprite = _label_sprites.get((fontpath, size, text))
+    if sprite is not None:
+        return sprite
+
+    font = _label_fonts.get((fontpath, size))
+    if font is None:
+        font = ImageFont.FreeTypeFont(fontpath, size=size)
+        _label_fonts[(fontpath, size)] = font
+
+    # bbox includes the outline, and may start left of or below the text origin
+    stroke = max(1, size // 8)
+    b_x1, b_y1, b_x2, b_y2 = font.getbbox(text, stroke_width=stroke)
+    sprite = Image.new('RGBA', (b_x2 - b_x1, b_y2 - b_y1), (0, 0, 0, 0))
+    ImageDraw.Draw(sprite).text((-b_x1, -b_y1), text, font=font, fill=LABEL_FG,
+                                stroke_width=stroke, stroke_fill=LABEL_OUTLINE)
+    _label_sprites[(fontpath, size, text)] = sprite
+    return sprite
+
+class LabelLayer(object):
+    """
+    City labels for a world, laid out with collision avoidance
+    Layouts are cached per cell size, so each zoom level is laid out once
+    """
+    fontpath = None
+    fontsize = 16           # Font size for the smallest tier
+    labels = None           # list of (abs_x, abs_y, name, size), in absolute OMT coordinates
+    _layouts = None         # dict of (cell_w, cell_h) -> list of (px, py, sprite)
+
+    def __init__(self, fontpath, fontsize=16):
+        self.fontpath = fontpath
+        self.fontsize = fontsize
+        self.labels = []
+        self._layouts = {}
+
+    def add_cities(self, omt_x, omt_y, cities, seen=None):
+        """
+        Add labels for @cities of overmap at omt_x, omt_y (from OvermapTile.cities)
+        If @seen (bool array from OvermapTile.get_seen()) is set, unseen cities are skipped
+        """
+        for c_x, c_y, name, size in cities:
+            if not name:
+                continue
+            if seen is not None and not seen[c_y][c_x]:
+                continue
+            self.labels.append(((omt_x * OMT_SZ) + c_x, (omt_y * OMT_SZ) + c_y, name, size))
+        self._layouts = {}
+
+    def layout(self, cell_w, cell_h):
+        """
+        Returns list of (px, py, sprite) for labels placed in world pixel coordinates,
+        with OMTs of @cell_w x @cell_h pixels. Larger cities are placed first; a label
+        that cannot be placed without overlapping another is dropped.
+        """
+        placed = self._layouts.get((cell_w, cell_h))
+        if placed is not None:
+            return placed
+
+        placed = []
+        buckets = {}
+        for abs_x, abs_y, name, size in sorted(self.labels, key=lambda x: (-x[3], x[2])):
+            tscale = [x[1] for x in LABEL_TIERS if size >= x[0]][0]
+            sprite = get_label_sprite(self.fontpath, int(self.fontsize * tscale), name)
+            s_w, s_h = sprite.size
+
+            # try centered on the city, then above, below, right and left of it
+            cx = (abs_x + 0.5) * cell_w
+            cy = (abs_y + 0.5) * cell_h
+            for px, py in ((cx - s_w / 2, cy - s_h / 2), (cx - s_w / 2, cy - s_h - cell_h),
+                           (cx - s_w / 2, cy + cell_h), (cx + cell_w, cy - s_h / 2),
+                           (cx - s_w - cell_w, cy - s_h / 2)):
+                tbox = (int(px), int(py), int(px) + s_w, int(py) + s_h)
+                if not self._collides(tbox, buckets):
+                    self._add_box(tbox, buckets)
+                    placed.append((tbox[0], tbox[1], sprite))
+                    break
+            else:
+                logger.debug("no room for label '%s' at <%d, %d>", name, abs_x, abs_y)
+
+        logger.debug("placed %d of %d labels for cell size %dx%d", len(placed), len(self.labels), cell_w, cell_h)
+        self._layouts[(cell_w, cell_h)] = placed
+        return placed
+
+    def _bucket_keys(self, tbox):
+        for bx in range(tbox[0] // LABEL_BUCKET, (tbox[2] // LABEL_BUCKET) + 1):
+            for by in range(tbox[1] // LABEL_BUCKET, (tbox[3] // LABEL_BUCKET) + 1):
+                yield (bx, by)
+
+    def _collides(self, tbox, buckets):
+        for tkey in self._bucket_keys(tbox):
+            for obox in buckets.get(tkey, []):
+                if tbox[0] < obox[2] and obox[0] < tbox[2] and tbox[1] < obox[3] and obox[1] < tbox[3]:
+                    return True
+        return False
+
+    def _add_box(self, tbox, buckets):
+        for tkey in self._bucket_keys(tbox):
+            buckets.setdefault(tkey, []).append(tbox)
+
+    def composite(self, im, origin_x, origin_y, cell_w, cell_h):
+        """
+        Composite labels onto PIL Image @im, whose top-left OMT is at absolute OMT
+        coordinates origin_x, origin_y, and whose OMTs are @cell_w x @cell_h pixels.
+        Returns a new RGBA Image; labels crossing the image edge are clipped, so
+        adjacent images line up.
+        """
+        oim = im.convert('RGBA') if im.mode != 'RGBA' else im.copy()
+        x0 = origin_x * cell_w
+        y0 = origin_y * cell_h
+        i_w, i_h = oim.size
+        for px, py, sprite in self.layout(cell_w, cell_h):
+            if px + sprite.size[0] <= x0 or py + sprite.size[1] <= y0 or px >= x0 + i_w or py >= y0 + i_h:
+                continue
+            oim.paste(sprite, (int(round(px - x0)), int(round(py - y0))), sprite)
+        return oim
@@ -21,12 +21,16 @@ Save filename formats (all files JSON with optional comment on line 1):
 
 import os
 import re
+import sys
 import json
 import logging
+from collections import OrderedDict
+
+import numpy as np
 
 from catamap.gamedata import GameData
-from catamap.colors import colorize_ansi, translate_color
-from catamap.render import OvermapTileImage
+from catamap.colors import COLORS, colorize_ansi, translate_color
+from catamap.render import OvermapTileImage, OvermapTileSVG
 from catamap import __version__, __date__
 
 logger = logging.getLogger('catamap')
@@ -34,6 +38,10 @@ logger = logging.getLogger('catamap')
 OMT_SZ = 180        # Overmap tile size (X & Y)
 SEG_SZ = 32         # Segment size
 MAP_SZ = 12         # Map size
+Z_MIN = -10         # Lowest Z-level
+Z_MAX = 10          # Highest Z-level
+Z_LEVELS = Z_MAX - Z_MIN + 1
+NO_TERRAIN = 0xFFFF # Terrain id for tiles with no layer data
 
 ULINES = {
     'end_south':    ('\u2502', 'VLINE',     0b1010, 1,  2),     # Vertical line
@@ -54,6 +62,8 @@ ULINES = {
     'nesw':         ('\u253C', 'PLUS',      0b1111, 15, 4),     # Large Plus or cross over
 }
 
+LINE_SYMS = [x[0] for x in ULINES.values()]
+
 UHOMES = {
     'north':    "^",
     'south':    "v",
@@ -71,98 +81,293 @@ URDIST = {
 class World(object):
     """
     Loads a world from the provided directory path,
-    then loads all overmaps, etc.
+    then loads overmaps on demand, up to @mem_budget bytes
     [World] -> Overmaps -> Maps -> Submaps
+
+    Overmaps are parsed on first access via get_tile(). When @mem_budget
+    is set, the least recently used overmaps are evicted once the estimated
+    size of all loaded overmaps exceeds the budget.
     """
     path = None
-    tiles = {}
+    tiles = None            # OrderedDict of (x, y) -> OvermapTile, in LRU order
+    tindex = None           # dict of (x, y) -> overmap filename
     gdata = None
+    mem_budget = None       # Memory budget in bytes (None for unlimited)
+    mem_used = 0            # Estimated memory used by loaded overmaps
+    export = None           # OvermapExport object, when loading from an exported world
+    visibility = None       # Visibility object, to mask unseen OMTs
+    stats = None            # Cache statistics
 
-    def __init__(self, path, gamedata: GameData):
+    def __init__(self, path, gamedata: GameData, mem_budget=None, export=None, visibility=None):
         self.gdata = gamedata
         self.path = os.path.realpath(os.path.expanduser(path))
+        self.mem_budget = mem_budget
+        self.export = export
+        self.visibility = visibility
+        self.tiles = OrderedDict()
+        self.tindex = {}
+        self.mem_used = 0
+        self.stats = {'hits': 0, 'misses': 0, 'loads': 0, 'evictions': 0, 'failed': 0}
         logger.debug("loading save data from directory: %s", self.path)
         self.load_world()
 
     def load_world(self):
         """
-        Read files from save directory, then load all necessary dependencies
+        Read files from save directory and index all available overmaps
+        Overmaps themselves are not parsed until requested by get_tile()
         """
+        if self.export is not None:
+            for omt_x, omt_y in self.export.list_tiles():
+                self.tindex[(omt_x, omt_y)] = self.export.path
+            logger.debug("indexed %d overmap tiles from export %s", len(self.tindex), self.export.path)
+            return True
+
         r_omap = re.compile(r'^o\.(?P<om_x>[\-0-9]+)\.(?P<om_y>[\-0-9]+)$')
         try:
             for tfile in os.scandir(self.path):
-                if r_omap.match(tfile):
-                    omapgd = r_omap.match(tfile).groupdict()
-                    omt_x = int(omapgd['x'])
-                    omt_y = int(omapgd['y'])
-                    if self.tiles.get(omt_x) is None:
-                        self.tiles[omt_x] = {}
-                    logger.debug("found overmap tile at <%d, %d> from file %s", omt_x, omt_y, tfile)
-                    self.tiles[omt_x][omt_y] = OvermapTile(omt_x, omt_y, omapgd)
-                    self.tiles[omt_x][omt_y].resolve_symbols(self.gdata)
+                tmatch = r_omap.match(tfile.name)
+                if tmatch:
+                    omt_x = int(tmatch.group('om_x'))
+                    omt_y = int(tmatch.group('om_y'))
+                    logger.debug("found overmap tile at <%d, %d> from file %s", omt_x, omt_y, tfile.name)
+                    self.tindex[(omt_x, omt_y)] = tfile.path
         except Exception as e:
             logger.error("failed to load overmap tiles: %s", str(e))
             return False
+        logger.debug("indexed %d overmap tiles", len(self.tindex))
         return True
 
+    def list_tiles(self):
+        """
+        Returns a sorted list of (x, y) coordinates of all available overmap tiles
+        """
+        return sorted(self.tindex)
+
     def get_tile(self, x, y):
         """
         Returns overmap tile at x,y
+        Loads the overmap on first access, evicting others if over budget
         """
-        try:
-            return self.tiles[x][y]
-        except:
+        ttile = self.tiles.get((x, y))
+        if ttile is not None:
+            self.tiles.move_to_end((x, y))
+            self.stats['hits'] += 1
+            return ttile
+
+        self.stats['misses'] += 1
+        if (x, y) not in self.tindex:
+            logger.debug("no overmap tile at <%d, %d>", x, y)
+            return None
+
+        ttile = self.load_tile(x, y)
+        if ttile is None:
+            return None
+
+        self.tiles[(x, y)] = ttile
+        self.mem_used += ttile.mem_usage()
+        self.evict()
+        return ttile
+
+    def get_layers(self, x, y):
+        """
+        Returns (terrain, layers) for overmap at x,y without resolving symbols
+        or adding it to the cache; see read_overmap_layers(). Returns None if not found.
+        """
+        if (x, y) not in self.tindex:
             logger.debug("no overmap tile at <%d, %d>", x, y)
             return None
 
+        ttile = self.tiles.get((x, y))
+        if ttile is not None and ttile.layers is not None:
+            return (ttile.terrain, ttile.layers)
+        if self.export is not None:
+            return (self.export.terrain, self.export.get_layers(x, y))
+        try:
+            return read_overmap_layers(self.tindex[(x, y)])
+        except Exception as e:
+            logger.error("failed to read overmap tile at <%d, %d>: %s", x, y, str(e))
+            return None
+
+    def load_tile(self, x, y):
+        """
+        Parse and resolve a single overmap tile at x,y without caching it
+        """
+        try:
+            if self.export is not None:
+                ttile = OvermapTile(x, y, None, layers=self.export.get_layers(x, y), terrain=self.export.terrain)
+            else:
+                ttile = OvermapTile(x, y, self.tindex[(x, y)])
+            ttile.resolve_symbols(self.gdata)
+            if self.visibility is not None:
+                ttile.set_seen(self.visibility.get_seen(x, y))
+        except Exception as e:
+            logger.error("failed to load overmap tile at <%d, %d>: %s", x, y, str(e))
+            self.stats['failed'] += 1
+            return None
+        self.stats['loads'] += 1
+        return ttile
+
+    def evict(self):
+        """
+        Evict least recently used overmaps until memory usage is within budget
+        The most recently used overmap is never evicted
+        """
+        if self.mem_budget is None:
+            return 0
+
+        evicted = 0
+        while self.mem_used > self.mem_budget and len(self.tiles) > 1:
+            (ox, oy), otile = self.tiles.popitem(last=False)
+            self.mem_used -= otile.mem_usage()
+            evicted += 1
+            logger.debug("evicted overmap tile at <%d, %d> (mem_used=%d, mem_budget=%d)",
+                         ox, oy, self.mem_used, self.mem_budget)
+        self.stats['evictions'] += evicted
+        return evicted
+
+    def render_svg(self, filename, fontsize=24, z=0, font_family='monospace'):
+        """
+        Render all overmaps at Z-level @z into a single SVG file @filename
+        Output is streamed one overmap row at a time, so only one row of
+        overmaps needs to be loaded at once
+        Overmaps that are entirely unseen (with @visibility set) are left empty
+        """
+        if not self.tindex:
+            logger.error("no overmap tiles to render")
+            return False
+
+        xs = [x[0] for x in self.tindex]
+        ys = [x[1] for x in self.tindex]
+        min_x, max_x = min(xs), max(xs)
+        min_y, max_y = min(ys), max(ys)
+        empty = [(None, None, None)] * OMT_SZ
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            ots = OvermapTileSVG(f, OMT_SZ * (max_x - min_x + 1), OMT_SZ * (max_y - min_y + 1),
+                                 fontsize=fontsize, font_family=font_family)
+            for oy in range(min_y, max_y + 1):
+                omaps = []
+                for ox in range(min_x, max_x + 1):
+                    # fully unseen overmaps are never loaded
+                    if self.visibility is not None and self.visibility.is_unseen(ox, oy, [z]):
+                        omaps.append(None)
+                        continue
+                    ttile = self.get_tile(ox, oy)
+                    omaps.append(ttile.get_overmap(z) if ttile is not None else None)
+
+                for y in range(OMT_SZ):
+                    cells = []
+                    for omap in omaps:
+                        if omap is None:
+                            cells += empty
+                        else:
+                            cells += [(x[0], *cell_colors(*x[:2])[:2]) for x in omap[y]]
+                    ots.plot_row(((oy - min_y) * OMT_SZ) + y, cells)
+            ots.close()
+        logger.debug("wrote world SVG to %s", filename)
+        return True
+
+    def cache_stats(self):
+        """
+        Returns a dict of overmap cache statistics
+        """
+        tstats = dict(self.stats)
+        tstats.update({
+            'loaded': len(self.tiles),
+            'available': len(self.tindex),
+            'mem_used': self.mem_used,
+            'mem_budget': self.mem_budget,
+        })
+        return tstats
+
 class OvermapTile(object):
     """
     Loads a single overmap tile, and all associated submap tiles for each map tile
     World -> [Overmaps] -> Maps -> Submaps
+
+    Terrain is kept as arrays of terrain ids, and symbols are resolved once per terrain id.
+    SubmapTile objects are only created when requested through get_tile(), and are not kept.
     """
     x = None
     y = None
     filename = None
-    tiles = {}
-
-    def __init__(self, x, y, filename):
-        logger.debug("init overmapTile at <%d, %d> (%s)", x, y, os.path.realpath(filename))
+    terrain = None          # list of omtype strings, indexed by terrain id
+    layers = None           # uint16 array of terrain ids, shape (Z_LEVELS, OMT_SZ, OMT_SZ)
+    resolved = None         # dict of terrain id -> (osym, overmap_terrain), set by resolve_symbols()
+    seen = None             # packed bitset of seen OMTs from catamap.visibility, or None to show all
+    cities = None           # list of (x, y, name, size) for cities in this overmap
+    _mem_usage = None
+
+    def __init__(self, x, y, filename, layers=None, terrain=None):
+        logger.debug("init overmapTile at <%d, %d> (%s)", x, y,
+                     os.path.realpath(filename) if filename else 'preloaded')
         self.x = x
         self.y = y
         self.filename = filename
-        self.parse()
+        self.resolved = {}
+        self.cities = []
+        if layers is not None:
+            self.layers = layers
+            self.terrain = terrain
+        else:
+            self.parse()
 
     def parse(self):
         """
         Parse a single overmap sector from JSON file
         """
         try:
-            with open(self.filename) as f:
-                # discard first line
-                vline = f.readline()
-                if not vline.startswith('#'):
-                    f.seek(0)
-                omjson = json.load(f)
+            omjson = read_save_json(self.filename)
+            self.terrain, self.layers = decode_layers(omjson)
+            self.cities = decode_cities(omjson)
         except Exception as e:
             logger.error("failed to parse JSON file '%s': %s", self.filename, str(e))
             return None
 
-        # Init Z-levels
-        for tz in range(-10, 11):
-            self.tiles[tz] = {}
-
-        # Read layers
-        # Starts with Z-level -10 up through +10 (21 total)
-        tz = -10
-        for tlayer in omjson['layers']:
-            idex = 0
-            for ttype, tlen in tlayer:
-                for tdex in range(tlen):
-                    coord = (*self.itoxy(idex), tz)
-                    # FIXME - change None to actual filename
-                    self.tiles[tz][idex] = SubmapTile(*coord, ttype, None)
-                    idex += 1
-            tz += 1
+    def set_seen(self, seen):
+        """
+        Set packed bitset of seen OMTs; unseen OMTs are rendered as unexplored
+        """
+        self.seen = seen
+
+    def get_seen(self, z=0):
+        """
+        Returns bool array of seen OMTs at Z-level @z, indexed [y][x], or None if not masked
+        """
+        if self.seen is None:
+            return None
+        return unpack_seen(self.seen, z)
+
+    def get_layer(self, z=0):
+        """
+        Returns the terrain id array for Z-level @z, indexed [y][x]
+        """
+        return self.layers[z - Z_MIN]
+
+    def get_masked_layer(self, z=0):
+        """
+        Returns the terrain id array for Z-level @z with unseen OMTs set to NO_TERRAIN
+        """
+        seen = self.get_seen(z)
+        if seen is None:
+            return self.get_layer(z)
+        return np.where(seen, self.get_layer(z), NO_TERRAIN)
+
+    def mem_usage(self) -> int:
+        """
+        Estimate memory used by parsed tile data, in bytes
+        Result is cached after the first call, since tiles are not modified after parsing
+        """
+        if self._mem_usage is not None:
+            return self._mem_usage
+
+        tsize = sys.getsizeof(self.resolved)
+        if self.filename is not None and self.layers is not None:
+            # preloaded layers (eg. from an export) are owned by the caller
+            tsize += self.layers.nbytes
+            tsize += sum(sys.getsizeof(x) for x in self.terrain)
+        self._mem_usage = tsize
+        return tsize
 
     def itoxy(self, idex):
         """
@@ -178,121 +383,76 @@ class OvermapTile(object):
 
     def get_tile(self, x, y, z=0):
         """
-        Fetch tile at (x,y,z)
+        Fetch tile at (x,y,z) as a new SubmapTile
+        Tiles are built from the layer array on each call and not cached, so they never
+        count against the World memory budget
         """
-        try:
-            return self.tiles[z][self.xytoi(x, y)]
-        except:
+        # negative indexes would wrap around the layer array
+        if not (0 <= x < OMT_SZ and 0 <= y < OMT_SZ and Z_MIN <= z <= Z_MAX) or self.layers is None:
+            logger.debug("no map tile at <%d, %d, %d>", x, y, z)
+            return None
+        tid = int(self.layers[z - Z_MIN, y, x])
+        if tid == NO_TERRAIN:
             logger.debug("no map tile at <%d, %d, %d>", x, y, z)
             return None
 
+        # FIXME - change None to actual filename
+        ttile = SubmapTile(x, y, z, self.terrain[tid], None)
+        ttile.osym, ttile.overmap_terrain = self.resolved.get(tid, (None, None))
+        return ttile
+
     def resolve_symbols(self, gdata: GameData):
         """
         Resolves data from @gdata to each overmap section
+        @gdata may also be a GameDataSnapshot from catamap.snapshot
         @returns True on success, False on failure
         """
-        try:
-            logger.debug("len(gdata.overmap_terrain) = %d", len(gdata.overmap_terrain))
-        except KeyError:
-            logger.error("overmap_terrain not loaded")
-            return False
-
-        r_ulines = re.compile(r'_(%s)$' % ('|'.join(ULINES)))
-        r_compass = re.compile(r'_(north|south|east|west)$')
-        uline_syms = {x[0]: x[2] for x in ULINES.values()}
-
-        for zlevel in self.tiles:
-            for tindex in self.tiles[zlevel]:
-                # check for LINEAR matches
-                if r_ulines.search(self.tiles[zlevel][tindex].omtype):
-                    omtype = r_ulines.sub('', self.tiles[zlevel][tindex].omtype)
-                    overmap_terrain = gdata.overmap_terrain.get(omtype)
-                    if overmap_terrain is not None:
-                        if 'LINEAR' in overmap_terrain.get('flags', []):
-                            self.tiles[zlevel][tindex].overmap_terrain = overmap_terrain
-
-                            # generate symbol for matching line direction
-                            ulmatch = False
-                            for tu in ULINES:
-                                if self.tiles[zlevel][tindex].omtype.endswith('_' + tu):
-                                    self.tiles[zlevel][tindex].osym = ULINES[tu][0]
-                                    ulmatch = True
-                                    break
-                            if not ulmatch:
-                                logger.warning("no ULINES direction match for %s", self.tiles[zlevel][tindex].omtype)
-                            continue
-                    else:
-                        logger.debug("no matching overmap_terrain for %s", omtype)
-
-                # for remaining non-transport stuff...
-                omtype = r_compass.sub('', self.tiles[zlevel][tindex].omtype)
-                overmap_terrain = gdata.overmap_terrain.get(omtype)
-                self.tiles[zlevel][tindex].overmap_terrain = overmap_terrain
-                if overmap_terrain is None:
-                    logger.warning("failed to get overmap_terrain for %s", omtype)
-                    continue
-
-                # ensure homes and other buildings using '^' point in the correct direction
-                if overmap_terrain.get('sym') == '^':
-                    ulmatch = False
-                    for tu in UHOMES:
-                        if self.tiles[zlevel][tindex].omtype.endswith('_' + tu):
-                            self.tiles[zlevel][tindex].osym = UHOMES[tu][0]
-                            ulmatch = True
-                            break
-                    if not ulmatch:
-                        logger.warning("no UHOMES direction match for %s", self.tiles[zlevel][tindex].omtype)
-
-                # ensure line symbols for structures are rotated in the correct direction
-                elif overmap_terrain.get('sym') in uline_syms:
-                    # determine rotation distance from north
-                    rot_dist = 0
-                    for tu in URDIST:
-                        if self.tiles[zlevel][tindex].omtype.endswith('_' + tu):
-                            rot_dist = URDIST[tu]
-                            break
-
-                    # determine new symbol
-                    # get current bit pattern for rotation
-                    cr_bits = uline_syms[overmap_terrain['sym']]
-
-                    # rotate symbol by amount specified in URDIST (0, 1, 2, 3)
-                    # mask out 'overflow' and shift back to the beginning
-                    cr_rot = (cr_bits << rot_dist & 0b01111) | (((cr_bits << rot_dist) & 0b011110000) >> 4)
-                    self.tiles[zlevel][tindex].osym = [x for x in ULINES.values() if x[2] == cr_rot][0][0]
-
+        if isinstance(gdata, GameData):
+            try:
+                oterrain = gdata.overmap_terrain
+                logger.debug("len(gdata.overmap_terrain) = %d", len(oterrain))
+            except KeyError:
+                logger.error("overmap_terrain not loaded")
+                return False
+            resolve = lambda omtype: resolve_omtype(omtype, oterrain)
+        else:
+            resolve = gdata.resolve_omtype
+
+        # each terrain id in this overmap is resolved once, then shared by all tiles of that type
+        # (an export's terrain list covers the whole world, so only ids present in layers are used)
+        self.resolved = {}
+        for tid in np.unique(self.layers).tolist():
+            if tid == NO_TERRAIN:
+                continue
+            self.resolved[tid] = resolve(self.terrain[tid])
+            if self.resolved[tid][1] is None:
+                logger.warning("failed to get overmap_terrain for %s", self.terrain[tid])
         return True
 
+    def get_cell(self, tid):
+        """
+        Returns (symbol, color, name, id) for terrain id @tid, as used by get_overmap()
+        """
+        if tid == NO_TERRAIN:
+            return ('#', 'gray', 'Unexplored', None)
+        osym, omter = self.resolved.get(tid, (None, None))
+        if omter is None:
+            logger.warning("missing overmap_terrain data for omtype=%s", self.terrain[tid])
+            return ('!', 'gray', 'Unknown', None)
+        sym = osym if osym is not None else omter.get('sym', '?')
+        if sym is None:
+            logger.warning("missing symbol for omtype=%s", self.terrain[tid])
+            return ('?', 'gray', 'Unknown', None)
+        return (sym, omter.get('color'), omter.get('name'), omter.get('id'))
+
     def get_overmap(self, z=0):
         """
         Generates a symbolic representation of overmap, similar to in-game
         Returns a 2D [y][x] array of (symbol, color, name, id)
         """
-        omap = []
-
-        for y in range(OMT_SZ):
-            tline = []
-            for x in range(OMT_SZ):
-                ttile = self.get_tile(x, y, z)
-                if ttile is None:
-                    tline.append(('#', 'gray', 'Unexplored', None))
-                else:
-                    omter = ttile.overmap_terrain
-                    if omter is None:
-                        tline.append(('!', 'gray', 'Unknown', None))
-                        logger.warning("missing overmap_terrain data at <%d,%d> (omtype=%s)", x, y, ttile.omtype)
-                    else:
-                        try:
-                            sym = ttile.osym if ttile.osym is not None else omter.get('sym', '?')
-                            tline.append((sym, omter.get('color'), omter.get('name'), omter.get('id')))
-                            if sym is None:
-                                logger.warning("missing symbol for <%d,%d> (omtype=%s)", x, y, ttile.omtype)
-                                tline.append(('?', 'gray', 'Unknown', None))
-                        except Exception as e:
-                            logger.warning("failed to get overmap info for <%d,%d> (omtype=%s): %s", x, y, ttile.omtype, str(e))
-                            tline.append(('?', 'gray', 'Unknown', None))
-            omap.append(tline)
-        return omap
+        layer = self.get_masked_layer(z)
+        cells = {tid: self.get_cell(tid) for tid in np.unique(layer).tolist()}
+        return [[cells[tid] for tid in row] for row in layer.tolist()]
 
     def render_overmap_ansi(self, z=0):
         """
@@ -306,32 +466,82 @@ class OvermapTile(object):
             outstr += '\n'
         return outstr
 
-    def render_overmap_imgtext(self, fontpath, fontsize=24, fpadding=0, z=0):
+    def render_overmap_imgtext(self, fontpath, fontsize=24, fpadding=0, z=0, imagemode='RGBA'):
         """
         Returns an  PIL Image object of overmap text rendered into an image
+        Use @imagemode 'P' to render into a fixed COLORS palette image
+        """
+        omap = self.get_overmap(z)
+        oti = OvermapTileImage(OMT_SZ, OMT_SZ, fontpath=fontpath, fontsize=fontsize, fpadding=fpadding,
+                               imagemode=imagemode)
+
+        for y in range(OMT_SZ):
+            for x in range(OMT_SZ):
+                t_fg, t_bg, t_line = cell_colors(*omap[y][x][:2])
+                oti.plot_tile(x, y, omap[y][x][0], t_fg, t_bg, t_line)
+        return oti
+
+    def render_overmap_svg(self, filename, fontsize=24, z=0, font_family='monospace'):
+        """
+        Render overmap text as an SVG file to @filename
         """
         omap = self.get_overmap(z)
-        oti = OvermapTileImage(OMT_SZ, OMT_SZ, fontpath=fontpath, fontsize=fontsize, fpadding=fpadding)
+        with open(filename, 'w', encoding='utf-8') as f:
+            ots = OvermapTileSVG(f, OMT_SZ, OMT_SZ, fontsize=fontsize, font_family=font_family)
+            for y in range(OMT_SZ):
+                ots.plot_row(y, [(x[0], *cell_colors(*x[:2])[:2]) for x in omap[y]])
+            ots.close()
+        logger.debug("wrote SVG output to %s", filename)
+        return True
+
+    def render_overmap_imgtiles(self, tileset, z=0):
+        """
+        Returns an OvermapTileImage of overmap rendered with sprites from @tileset
+        Tiles without a matching sprite are drawn as blocks of their overmap color
+        """
+        oti = OvermapTileImage(OMT_SZ, OMT_SZ, None, rendermode='tiles', tileset=tileset)
 
-        line_syms = [x[0] for x in ULINES.values()]
+        # sprites per terrain id, so each cell is a dict lookup and a paste
+        # unseen tiles are NO_TERRAIN, and use the tileset's unexplored sprite if it has one
+        tsprites = {NO_TERRAIN: None}
+        if self.seen is not None:
+            slist = tileset.resolve('unexplored_terrain')
+            if slist:
+                tsprites[NO_TERRAIN] = [tileset.get_sprite(*ts) for ts in slist]
 
+        layer = self.get_masked_layer(z).tolist()
         for y in range(OMT_SZ):
             for x in range(OMT_SZ):
-                try:
-                    t_fg, t_bg = translate_color(omap[y][x][1], 'rgb')
-                except:
-                    t_fg = (255, 255, 255)
-                    t_bg = None
-                t_sym = omap[y][x][0]
-                if t_sym in line_syms:
-                    t_line = True
-                    t_bg = None
-                    logger.debug("unset t_bg for line_sym match")
+                tid = layer[y][x]
+                if tid not in tsprites:
+                    tsprites[tid] = self._tile_sprites(tileset, tid)
+                sprites = tsprites[tid]
+                if sprites is None:
+                    continue
+
+                if isinstance(sprites, list):
+                    oti.plot_sprites(x, y, sprites)
                 else:
-                    t_line = False
-                oti.plot_tile(x, y, t_sym, t_fg, t_bg, t_line)
+                    oti.plot_block(x, y, sprites)
         return oti
 
+    def _tile_sprites(self, tileset, tid):
+        """
+        Returns list of sprites from @tileset for terrain id @tid, or an (r,g,b) block color
+        for terrain without a matching sprite
+        """
+        overmap_terrain = self.resolved.get(tid, (None, None))[1]
+        slist = tileset.resolve(self.terrain[tid], overmap_terrain)
+        if slist is not None:
+            return [tileset.get_sprite(*ts) for ts in slist]
+
+        # use background color for inverted colors (eg. i_light_blue)
+        try:
+            t_fg, t_bg = translate_color(overmap_terrain.get('color'), 'rgb')
+            return t_fg if t_bg == COLORS['black'][1] else t_bg
+        except:
+            return (255, 255, 255)
+
 class SubmapTile(object):
     """
     Loads a single map tile, and all associated submap tiles
@@ -351,6 +561,148 @@ class SubmapTile(object):
         self.z = z
         self.omtype = omtype
 
+_r_ulines = re.compile(r'_(%s)$' % ('|'.join(ULINES)))
+_r_compass = re.compile(r'_(north|south|east|west)$')
+_uline_syms = {x[0]: x[2] for x in ULINES.values()}
+
+def resolve_omtype(omtype, oterrain):
+    """
+    Resolve @omtype (eg. 'road_ns', 'house_north') against dict of overmap_terrain @oterrain
+    Returns (osym, overmap_terrain), where @osym is the direction-specific symbol or None,
+    and @overmap_terrain is None if no matching overmap_terrain exists
+    """
+    # check for LINEAR matches
+    if _r_ulines.search(omtype):
+        overmap_terrain = oterrain.get(_r_ulines.sub('', omtype))
+        if overmap_terrain is not None:
+            if 'LINEAR' in overmap_terrain.get('flags', []):
+                # generate symbol for matching line direction
+                for tu in ULINES:
+                    if omtype.endswith('_' + tu):
+                        return (ULINES[tu][0], overmap_terrain)
+                logger.warning("no ULINES direction match for %s", omtype)
+                return (None, overmap_terrain)
+        else:
+            logger.debug("no matching overmap_terrain for %s", _r_ulines.sub('', omtype))
+
+    # for remaining non-transport stuff...
+    overmap_terrain = oterrain.get(_r_compass.sub('', omtype))
+    if overmap_terrain is None:
+        return (None, None)
+
+    # ensure homes and other buildings using '^' point in the correct direction
+    if overmap_terrain.get('sym') == '^':
+        for tu in UHOMES:
+            if omtype.endswith('_' + tu):
+                return (UHOMES[tu][0], overmap_terrain)
+        logger.debug("no UHOMES direction match for %s", omtype)
+
+    # ensure line symbols for structures are rotated in the correct direction
+    elif overmap_terrain.get('sym') in _uline_syms:
+        # determine rotation distance from north
+        rot_dist = 0
+        for tu in URDIST:
+            if omtype.endswith('_' + tu):
+                rot_dist = URDIST[tu]
+                break
+
+        # determine new symbol
+        # get current bit pattern for rotation
+        cr_bits = _uline_syms[overmap_terrain['sym']]
+
+        # rotate symbol by amount specified in URDIST (0, 1, 2, 3)
+        # mask out 'overflow' and shift back to the beginning
+        cr_rot = (cr_bits << rot_dist & 0b01111) | (((cr_bits << rot_dist) & 0b011110000) >> 4)
+        return ([x for x in ULINES.values() if x[2] == cr_rot][0][0], overmap_terrain)
+
+    return (None, overmap_terrain)
+
+def cell_colors(sym, color):
+    """
+    Returns (fg, bg, line) for an overmap cell with symbol @sym and Cataclysm color @color
+    @fg and @bg are (r,g,b) tuples or None; line symbols never get a background
+    """
+    try:
+        t_fg, t_bg = translate_color(color, 'rgb')
+    except:
+        t_fg = (255, 255, 255)
+        t_bg = None
+    if sym in LINE_SYMS:
+        logger.debug("unset t_bg for line_sym match")
+        return (t_fg, None, True)
+    return (t_fg, t_bg, False)
+
+def unpack_seen(seen, z=0):
+    """
+    Unpack Z-level @z of packed seen bitset @seen into a bool array indexed [y][x]
+    See catamap.visibility for the bitset format
+    """
+    return np.unpackbits(seen[z - Z_MIN], count=OMT_SZ * OMT_SZ).astype(bool).reshape((OMT_SZ, OMT_SZ))
+
+def read_save_json(filename):
+    """
+    Read JSON file @filename from a save directory (overmap, .map, .seen), skipping the
+    optional version comment on line 1
+    """
+    with open(filename) as f:
+        # discard first line
+        vline = f.readline()
+        if not vline.startswith('#'):
+            f.seek(0)
+        return json.load(f)
+
+def read_overmap_layers(filename):
+    """
+    Read terrain layers from overmap JSON file @filename
+    See decode_layers() for the return value
+    """
+    return decode_layers(read_save_json(filename))
+
+def decode_cities(omjson):
+    """
+    Returns list of (x, y, name, size) for each city in overmap JSON @omjson
+    @x and @y are OMT coordinates within the overmap; cities outside of it are skipped
+    """
+    cities = []
+    for tcity in omjson.get('cities', []):
+        c_x, c_y = tcity.get('pos', (tcity.get('x'), tcity.get('y')))[:2]
+        if c_x is None or c_y is None:
+            logger.debug("skipping city without position: %s", str(tcity))
+            continue
+        if not (isinstance(c_x, int) and isinstance(c_y, int) and 0 <= c_x < OMT_SZ and 0 <= c_y < OMT_SZ):
+            logger.debug("skipping city outside of overmap: %s", str(tcity))
+            continue
+        cities.append((c_x, c_y, tcity.get('name', ''), tcity.get('size', 0)))
+    return cities
+
+def decode_layers(omjson):
+    """
+    Decode terrain layers from overmap JSON @omjson
+    Returns a tuple of (terrain, layers), where @terrain is a list of omtype strings
+    and @layers is a uint16 array of indexes into @terrain, shape (Z_LEVELS, OMT_SZ, OMT_SZ).
+    Z-levels missing from the file are filled with NO_TERRAIN.
+    """
+    terrain = []
+    tids = {}
+    layers = np.full((Z_LEVELS, OMT_SZ * OMT_SZ), NO_TERRAIN, dtype=np.uint16)
+
+    # Starts with Z-level -10 up through +10 (21 total)
+    for zdex, tlayer in enumerate(omjson['layers'][:Z_LEVELS]):
+        if not tlayer:
+            continue
+        run_ids = []
+        run_lens = []
+        for ttype, tlen in tlayer:
+            if ttype not in tids:
+                tids[ttype] = len(terrain)
+                terrain.append(ttype)
+            run_ids.append(tids[ttype])
+            run_lens.append(tlen)
+        tline = np.repeat(np.array(run_ids, dtype=np.uint16), run_lens)
+        layers[zdex, :len(tline)] = tline[:OMT_SZ * OMT_SZ]
+
+    return (terrain, layers.reshape((Z_LEVELS, OMT_SZ, OMT_SZ)))
+
 def omttoseg(x, y, z):
     """
     Translate overmap coordinates to segment number
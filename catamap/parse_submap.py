@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+"""
+
+catamap.parse_submap
+Parse and render submaps, one segment at a time
+
+License: GPLv3
+Repo: <https://git.ycnrg.org/projects/GTOOL/repos/catamap>
+
+Copyright (c) 2019 J. Hipps <jacob@ycnrg.org>
+https://ycnrg.org/
+
+
+Each OMT is 2x2 submaps of MAP_SZ x MAP_SZ terrain cells (OMT_CELLS x OMT_CELLS),
+so a segment of SEG_SZ x SEG_SZ OMTs is rendered as one SEG_CELLS x SEG_CELLS image.
+
+Output filename format:
+
+[outdir]/s.SEG_X.SEG_Y.SEG_Z.EXT - Segment render
+
+"""
+
+import os
+import re
+import logging
+
+import numpy as np
+
+from catamap.gamedata import GameData, C_SUBDIRS
+from catamap.colors import COLORS, translate_color
+from catamap.parse_overmap import World, read_save_json, OMT_SZ, SEG_SZ, MAP_SZ, LINE_SYMS
+from catamap.render import OvermapTileImage
+from catamap import __version__, __date__
+
+logger = logging.getLogger('catamap')
+
+OMT_CELLS = MAP_SZ * 2              # Terrain cells per OMT (X & Y)
+SEG_CELLS = OMT_CELLS * SEG_SZ      # Terrain cells per segment (X & Y)
+SUBMAP_SUBDIRS = C_SUBDIRS + ['furniture_and_terrain']
+
+# Line drawing symbols used by terrain & furniture; X/O is connection to N, E, S, W
+LINE_SYMBOLS = {
+    'LINE_XOXO': '│',
+    'LINE_OXOX': '─',
+    'LINE_XXOO': '└',
+    'LINE_OXXO': '┌',
+    'LINE_OOXX': '┐',
+    'LINE_XOOX': '┘',
+    'LINE_XXXO': '├',
+    'LINE_XXOX': '┴',
+    'LINE_XOXX': '┤',
+    'LINE_OXXX': '┬',
+    'LINE_XXXX': '┼',
+}
+
+UNKNOWN_SYM = ('?', COLORS['dark_gray'][1], None)
+
+
+def build_symbol_table(gdata: GameData) -> dict:
+    """
+    Resolve terrain and furniture from @gdata into a lookup table, once per run
+    Returns {'terrain': {id: (sym, fg, bg)}, 'furniture': {id: (sym, fg, bg)}},
+    where @fg and @bg are (r,g,b) tuples or None
+    """
+    symtab = {}
+    for ttype in ('terrain', 'furniture'):
+        symtab[ttype] = {}
+        try:
+            tdata = gdata[ttype]
+        except KeyError:
+            logger.warning("no %s loaded in game data", ttype)
+            continue
+
+        for tid, tobj in tdata.items():
+            # objects resolved from an abstract base inherit its 'abstract' key, so check 'id'
+            if tobj.get('id') is None:
+                continue
+            sym = tobj.get('symbol', '?')
+            if isinstance(sym, list):
+                sym = sym[0]
+            sym = LINE_SYMBOLS.get(sym, sym)
+
+            fg = None
+            bg = None
+            tcolor = tobj.get('color')
+            if isinstance(tcolor, list):
+                tcolor = tcolor[0]
+            tbgcolor = tobj.get('bgcolor')
+            if isinstance(tbgcolor, list):
+                tbgcolor = tbgcolor[0]
+            try:
+                if tcolor:
+                    fg, bg = translate_color(tcolor, 'rgb')
+                if tbgcolor:
+                    bg = translate_color(tbgcolor, 'rgb')[0]
+            except:
+                logger.debug("failed to translate color for %s '%s'", ttype, tid)
+            if bg == COLORS['black'][1]:
+                bg = None
+            symtab[ttype][tid] = (sym, fg or COLORS['white'][1], bg)
+
+    logger.debug("built symbol table: %d terrain, %d furniture",
+                 len(symtab['terrain']), len(symtab['furniture']))
+    return symtab
+
+def list_segments(world: World, xrange=None, yrange=None, zlevels=None):
+    """
+    Returns a sorted list of (seg_x, seg_y, seg_z, path) for all segment directories in @world,
+    optionally limited to segments overlapping overmaps in @xrange & @yrange and Z-levels in @zlevels
+    """
+    r_seg = re.compile(r'^(?P<x>-?[0-9]+)\.(?P<y>-?[0-9]+)\.(?P<z>-?[0-9]+)$')
+    mapdir = os.path.join(world.path, 'maps')
+    segs = []
+    try:
+        for tdir in os.scandir(mapdir):
+            tmatch = r_seg.match(tdir.name)
+            if not tmatch or not tdir.is_dir():
+                continue
+            seg_x, seg_y, seg_z = (int(x) for x in tmatch.groups())
+            if zlevels is not None and seg_z not in zlevels:
+                continue
+            if not _seg_overlaps(seg_x, xrange) or not _seg_overlaps(seg_y, yrange):
+                continue
+            segs.append((seg_x, seg_y, seg_z, tdir.path))
+    except Exception as e:
+        logger.error("failed to list segments in %s: %s", mapdir, str(e))
+    return sorted(segs)
+
+def _seg_overlaps(seg, orange):
+    """
+    Returns True if segment coordinate @seg overlaps inclusive overmap range @orange
+    """
+    if orange is None:
+        return True
+    return (seg * SEG_SZ) <= ((orange[1] + 1) * OMT_SZ - 1) and ((seg + 1) * SEG_SZ - 1) >= (orange[0] * OMT_SZ)
+
+def read_map_file(filename):
+    """
+    Read a .map file, which holds the submaps of a single OMT
+    Returns a list of (smx, smy, smz, terrain, furniture), where @terrain is a list of
+    MAP_SZ * MAP_SZ terrain ids in row order, and @furniture is a list of (x, y, id)
+    """
+    mjson = read_save_json(filename)
+
+    submaps = []
+    for tsub in mjson:
+        smx, smy, smz = tsub['coordinates']
+
+        # terrain is run-length encoded as "id" or ["id", count]
+        terrain = []
+        for tter in tsub.get('terrain', []):
+            if isinstance(tter, list):
+                terrain += [tter[0]] * tter[1]
+            else:
+                terrain.append(tter)
+
+        furniture = [(x[0], x[1], x[2]) for x in tsub.get('furniture', [])]
+        submaps.append((smx, smy, smz, terrain, furniture))
+    return submaps
+
+def render_segment(seg_x, seg_y, seg_z, segpath, symtab, fontpath, fontsize=24, fpadding=0, imagemode='RGBA',
+                   seen=None):
+    """
+    Render all submaps in segment directory @segpath into a single OvermapTileImage
+    Symbols are resolved through @symtab from build_symbol_table(), or a GameDataSnapshot
+    If @seen is set, submaps of OMTs not in the packed (SEG_SZ, SEG_SZ) bitset are left blank
+    """
+    # submap coordinates of segment origin
+    sm_x0 = seg_x * SEG_SZ * 2
+    sm_y0 = seg_y * SEG_SZ * 2
+    if seen is not None:
+        seen = np.unpackbits(seen, count=SEG_SZ * SEG_SZ).astype(bool).reshape((SEG_SZ, SEG_SZ)).tolist()
+    oti = OvermapTileImage(SEG_CELLS, SEG_CELLS, fontpath=fontpath, fontsize=fontsize, fpadding=fpadding,
+                           imagemode=imagemode)
+    t_ter = symtab['terrain']
+    t_furn = symtab['furniture']
+
+    for tfile in os.scandir(segpath):
+        if not tfile.name.endswith('.map'):
+            continue
+        try:
+            submaps = read_map_file(tfile.path)
+        except Exception as e:
+            logger.warning("failed to parse map file '%s': %s", tfile.path, str(e))
+            continue
+
+        for smx, smy, _, terrain, furniture in submaps:
+            c_x0 = (smx - sm_x0) * MAP_SZ
+            c_y0 = (smy - sm_y0) * MAP_SZ
+            if not (0 <= c_x0 < SEG_CELLS and 0 <= c_y0 < SEG_CELLS):
+                logger.debug("submap <%d, %d> is outside segment <%d, %d, %d>", smx, smy, seg_x, seg_y, seg_z)
+                continue
+            if seen is not None and not seen[(smy - sm_y0) // 2][(smx - sm_x0) // 2]:
+                continue
+
+            cells = [t_ter.get(x, UNKNOWN_SYM) for x in terrain]
+            for f_x, f_y, f_id in furniture:
+                # furniture is drawn over terrain, keeping the terrain background
+                f_sym, f_fg, f_bg = t_furn.get(f_id, UNKNOWN_SYM)
+                tdex = (f_y * MAP_SZ) + f_x
+                if tdex < len(cells):
+                    cells[tdex] = (f_sym, f_fg, f_bg or cells[tdex][2])
+
+            for tdex, (sym, fg, bg) in enumerate(cells):
+                line = sym in LINE_SYMS
+                oti.plot_tile(c_x0 + (tdex % MAP_SZ), c_y0 + (tdex // MAP_SZ), sym, fg, None if line else bg, line)
+    return oti
+
+def segment_output_path(outdir, seg_x, seg_y, seg_z, fmt):
+    """
+    Returns output filename for segment at seg_x, seg_y, seg_z
+    """
+    return os.path.join(outdir, 's.%d.%d.%d.%s' % (seg_x, seg_y, seg_z, fmt))
@@ -13,15 +13,30 @@ https://ycnrg.org/
 
 """
 
+import os
 import logging
 from typing import NewType
+from xml.sax.saxutils import escape
 
 from PIL import Image, ImageDraw, ImageFont
 
+from catamap.colors import COLORS, PALETTE, get_palette, palette_index
 from catamap import __version__, __date__
 
 logger = logging.getLogger('catamap')
 
+# Output formats and default encoder settings for save_image()
+OUTPUT_FORMATS = {
+    'png':  {'format': 'PNG', 'compress_level': 6},
+    'webp': {'format': 'WEBP', 'lossless': True, 'method': 4},
+}
+
+# valid (min, max) compress_level for each output format: PNG zlib level, WebP method
+COMPRESS_LEVELS = {
+    'png':  (0, 9),
+    'webp': (0, 6),
+}
+
 
 class OvermapTileImage(object):
     """
@@ -30,9 +45,11 @@ class OvermapTileImage(object):
     im = None               # Image object
     draw = None             # ImageDraw object
     font = None             # ImageFont object
+    tileset = None          # Tileset object (tiles mode)
     lfont = None            # Line-drawing ImageFont object
     bg = (0, 0, 0, 255)     # RGBA bg color
-    rmode = 'text'          # Render mode (text, tiles, vector)
+    rmode = 'text'          # Render mode (text, tiles); vector output uses OvermapTileSVG
+    imode = 'RGBA'          # Image mode (RGBA, or P for fixed COLORS palette)
     single = False          # Single-tile mode (when enabled, removes outer padding)
     fpadding = 4            # Text mode: outer glyph padding
     fpad_bot = 4            # Text mode: inner bottom glyph pad
@@ -41,25 +58,37 @@ class OvermapTileImage(object):
     t_h = 0                 # OM Tile height
     i_w = 0                 # Image width
     i_h = 0                 # Image height
-    f_w = 0                 # Font width
-    f_h = 0                 # Font height
+    f_w = 0                 # Font width (tile width in tiles mode)
+    f_h = 0                 # Font height (tile height in tiles mode)
 
     def __init__(self, t_w, t_h, fontpath, fontsize=24, bg=(0, 0, 0, 255), rendermode='text',
-                 fpadding=4, single=False):
+                 fpadding=4, single=False, imagemode='RGBA', tileset=None):
         self.t_w = t_w
         self.t_h = t_h
         self.rmode = rendermode
+        if imagemode not in ('RGBA', 'P'):
+            logger.error("unsupported image mode '%s', using RGBA", imagemode)
+            imagemode = 'RGBA'
+        self.imode = imagemode
         self.bg = bg
         self.fpadding = fpadding
         self.single = single
 
-        try:
-            self.font = ImageFont.FreeTypeFont(fontpath, size=fontsize)
-            #self.lfont = self.font.font_variant(size=int(fontsize + 2))
-            self.lfont = self.font.font_variant(size=(fontsize - 2))
-            logger.debug("using font: %s (%s)", *self.font.getname())
-        except Exception as e:
-            logger.error("failed to open font '%s': %s", fontpath, str(e))
+        if self.rmode == 'tiles':
+            # sprites are full-color, and are placed edge to edge
+            self.tileset = tileset
+            self.fpadding = 0
+            if self.imode != 'RGBA':
+                logger.warning("image mode '%s' not supported for tiles, using RGBA", self.imode)
+                self.imode = 'RGBA'
+        else:
+            try:
+                self.font = ImageFont.FreeTypeFont(fontpath, size=fontsize)
+                #self.lfont = self.font.font_variant(size=int(fontsize + 2))
+                self.lfont = self.font.font_variant(size=(fontsize - 2))
+                logger.debug("using font: %s (%s)", *self.font.getname())
+            except Exception as e:
+                logger.error("failed to open font '%s': %s", fontpath, str(e))
 
         self._init_image()
 
@@ -69,10 +98,16 @@ class OvermapTileImage(object):
         """
         # calculate dimensions
         # this assumes a fixed-width font is used!
-        self.f_w, self.f_h = self.font.getsize('X')
-        logger.debug("calculated font glyph size (unpadded): %d x %d", self.f_w, self.f_h)
-        if self.font.getsize('X')[0] != self.font.getsize('!')[0]:
-            logger.warning("chosen font is not fixed-width. this will likley break image output!")
+        if self.rmode == 'tiles':
+            self.f_w, self.f_h = self.tileset.tile_w, self.tileset.tile_h
+            logger.debug("using tileset tile size: %d x %d", self.f_w, self.f_h)
+        else:
+            # glyph height is the bottom of the bbox, so it includes the ascender offset
+            self.f_w = int(self.font.getlength('X'))
+            self.f_h = self.font.getbbox('X')[3]
+            logger.debug("calculated font glyph size (unpadded): %d x %d", self.f_w, self.f_h)
+            if self.font.getlength('X') != self.font.getlength('!'):
+                logger.warning("chosen font is not fixed-width. this will likley break image output!")
 
         # calculate image size
         self.i_w = ((self.f_w + self.fpadding) * self.t_w) - (0 if self.single else self.fpadding)
@@ -80,7 +115,12 @@ class OvermapTileImage(object):
         logger.debug("calculated image size: %d x %d", self.i_w, self.i_h)
 
         # create image & draw objects
-        self.im = Image.new('RGBA', (self.i_w, self.i_h), self.bg)
+        # in palette mode, colors are drawn as indexes into the COLORS palette
+        if self.imode == 'P':
+            self.im = Image.new('P', (self.i_w, self.i_h), palette_index(self.bg))
+            self.im.putpalette(get_palette())
+        else:
+            self.im = Image.new('RGBA', (self.i_w, self.i_h), self.bg)
         self.draw = ImageDraw.Draw(self.im)
 
     def plot_tile(self, x, y, txt, fg, bg, line=False):
@@ -107,13 +147,162 @@ class OvermapTileImage(object):
             tx_y -= self.fpad_bot
             tfont = self.lfont
 
+        if self.imode == 'P':
+            fg = palette_index(fg)
+            bg = palette_index(bg) if bg is not None else None
+
         if bg is not None:
             self.draw.rectangle(((bg_x1, bg_y1), (bg_x2, bg_y2)), fill=bg)
         self.draw.text((tx_x, tx_y), txt, fill=fg, font=tfont)
 
-    def save_image(self, filename):
+    def plot_sprites(self, x, y, sprites):
+        """
+        Paste tileset sprites onto overmap
+
+        @x and @y are overmap coordinates
+        @sprites is a list of (Image, mask, offset_x, offset_y) from Tileset.get_sprite(),
+        background first. Opaque sprites (mask of None) are copied without blending.
+        """
+        tx_x = x * (self.f_w + self.fpadding)
+        tx_y = y * (self.f_h + self.fpadding)
+        for sim, smask, s_ox, s_oy in sprites:
+            self.im.paste(sim, (tx_x + s_ox, tx_y + s_oy), smask)
+
+    def plot_block(self, x, y, color):
+        """
+        Fill a single tile on overmap with (r,g,b) @color
+        Used in tiles mode when the tileset has no sprite for a tile
+        """
+        bg_x1 = x * (self.f_w + self.fpadding)
+        bg_y1 = y * (self.f_h + self.fpadding)
+        bg_x2 = bg_x1 + self.f_w - 1
+        bg_y2 = bg_y1 + self.f_h - 1
+        self.draw.rectangle(((bg_x1, bg_y1), (bg_x2, bg_y2)), fill=color)
+
+    def save_image(self, filename, fmt=None, compress_level=None, optimize=False):
         """
         Output image to file @filename
+
+        @fmt is a key of OUTPUT_FORMATS; when omitted, it is guessed from the file extension
+        @compress_level sets the PNG zlib level (0-9) or WebP method (0-6)
+        If @optimize is true, the encoder makes an extra pass for smaller output
+        """
+        if fmt is None:
+            fmt = os.path.splitext(filename)[1].lstrip('.').lower() or 'png'
+        if fmt not in OUTPUT_FORMATS:
+            logger.error("unsupported output format '%s'", fmt)
+            return False
+
+        if compress_level is not None and not COMPRESS_LEVELS[fmt][0] <= compress_level <= COMPRESS_LEVELS[fmt][1]:
+            logger.error("compress level %d is out of range for %s (%d-%d)", compress_level, fmt, *COMPRESS_LEVELS[fmt])
+            return False
+
+        sopts = dict(OUTPUT_FORMATS[fmt])
+        if fmt == 'png':
+            if compress_level is not None:
+                sopts['compress_level'] = compress_level
+            sopts['optimize'] = optimize
+        elif fmt == 'webp':
+            if compress_level is not None:
+                sopts['method'] = compress_level
+            if optimize:
+                sopts['method'] = 6
+
+        self.im.save(filename, **sopts)
+        logger.debug("wrote %s output to %s", fmt, filename)
+        return True
+
+class OvermapTileSVG(object):
+    """
+    Renders overmap symbols to an SVG file, streamed row by row
+
+    Horizontal runs of the same background color are merged into a single rect,
+    and glyphs in each row are grouped into one text element per color. Colors
+    use shared CSS classes, one per COLORS entry.
+    """
+    fobj = None             # Output file object
+    t_w = 0                 # OM Tile width
+    t_h = 0                 # OM Tile height
+    c_w = 0                 # Cell width
+    c_h = 0                 # Cell height
+    fontsize = 24           # Font size
+    font_family = 'monospace'
+    bg = (0, 0, 0)          # RGB bg color
+    rows = 0                # Rows written so far
+
+    def __init__(self, fobj, t_w, t_h, fontsize=24, font_family='monospace', bg=(0, 0, 0)):
+        self.fobj = fobj
+        self.t_w = t_w
+        self.t_h = t_h
+        self.fontsize = fontsize
+        self.font_family = font_family
+        self.bg = bg
+        # assumes a fixed-width font with the usual 3:5 aspect ratio
+        self.c_w = round(fontsize * 0.6, 2)
+        self.c_h = fontsize
+        self._write_header()
+
+    def _write_header(self):
+        """
+        Write SVG root element and shared color styles
+        """
+        i_w = round(self.c_w * self.t_w, 2)
+        i_h = self.c_h * self.t_h
+        self.fobj.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.fobj.write('<svg xmlns="http://www.w3.org/2000/svg" width="%s" height="%s" viewBox="0 0 %s %s">\n'
+                        % (i_w, i_h, i_w, i_h))
+        self.fobj.write('<style>text{font-family:%s;font-size:%dpx}' % (self.font_family, self.fontsize))
+        for i, cname in enumerate(PALETTE):
+            self.fobj.write('.c%d{fill:#%02x%02x%02x}' % (i, *COLORS[cname][1]))
+        self.fobj.write('</style>\n')
+        self.fobj.write('<rect width="100%%" height="100%%" class="c%d"/>\n' % (palette_index(self.bg)))
+
+    def plot_row(self, y, cells):
+        """
+        Write a single row of the overmap
+
+        @y is the overmap row
+        @cells is a list of (txt, fg, bg) for each column; @fg and @bg are (r,g,b) tuples
+        or None, and @txt may be None to leave a cell empty
+        """
+        ty = self.c_h * y
+        self.fobj.write('<g>')
+
+        # merge runs of identical background color; the image background is not redrawn
+        bg_default = palette_index(self.bg)
+        run_start = 0
+        run_color = None
+        for x, (_, _, bg) in enumerate(cells + [(None, None, None)]):
+            tcolor = palette_index(bg) if bg is not None else None
+            if tcolor == bg_default:
+                tcolor = None
+            if tcolor != run_color:
+                if run_color is not None:
+                    self.fobj.write('<rect x="%s" y="%s" width="%s" height="%s" class="c%d"/>'
+                                    % (round(self.c_w * run_start, 2), ty,
+                                       round(self.c_w * (x - run_start), 2), self.c_h, run_color))
+                run_start = x
+                run_color = tcolor
+
+        # group glyphs by color, using per-glyph x positions
+        glyphs = {}
+        for x, (txt, fg, _) in enumerate(cells):
+            if not txt or txt == ' ' or fg is None:
+                continue
+            tglyphs = glyphs.setdefault(palette_index(fg), ([], []))
+            tglyphs[0].append(str(round(self.c_w * x, 2)))
+            tglyphs[1].append(txt)
+        for tcolor, (txs, tsyms) in glyphs.items():
+            self.fobj.write('<text y="%s" x="%s" class="c%d">%s</text>'
+                            % (round(ty + self.c_h * 0.8, 2), ' '.join(txs), tcolor, escape(''.join(tsyms))))
+
+        self.fobj.write('</g>\n')
+        self.rows += 1
+
+    def close(self):
+        """
+        Finish SVG document
+        The file object itself is left open for the caller to close
         """
-        self.im.save(filename)
-        logger.debug("wrote output to %s", filename)
+        self.fobj.write('</svg>\n')
+        logger.debug("wrote %d SVG rows", self.rows)
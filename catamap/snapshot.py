@@ -0,0 +1,372 @@
+#!/usr/bin/python3
+"""
+
+catamap.snapshot
+Read-only game data snapshot, shared by worker processes
+
+License: GPLv3
+Repo: <https://git.ycnrg.org/projects/GTOOL/repos/catamap>
+
+Copyright (c) 2019 J. Hipps <jacob@ycnrg.org>
+https://ycnrg.org/
+
+
+The parent process resolves game data once and writes the results to a snapshot
+file (on /dev/shm where available). Workers map the file read-only, so all
+processes share the same pages and nothing is parsed or copied on attach.
+
+Snapshot file layout (all values little-endian):
+
+[header]    - SNAP_HEADER
+[strtab]    - uint32 offsets of each string into the string blob (n_strings + 1), followed by the UTF-8 blob
+[omtypes]   - SNAP_OMTYPE record per omtype, sorted by omtype
+[terrain]   - SNAP_SYMBOL record per terrain id, sorted by id
+[furniture] - SNAP_SYMBOL record per furniture id, sorted by id
+
+Record fields other than colors are indexes into the string table, or SNAP_NONE.
+
+"""
+
+import os
+import mmap
+import struct
+import bisect
+import logging
+import tempfile
+
+import numpy as np
+
+from catamap.gamedata import GameData
+from catamap.export import pad_to
+from catamap.parse_overmap import resolve_omtype, ULINES, URDIST
+from catamap.parse_submap import build_symbol_table
+from catamap import __version__, __date__
+
+logger = logging.getLogger('catamap')
+
+SNAP_MAGIC = b'CMGD'
+SNAP_VERSION = 1
+SNAP_ALIGN = 8
+SNAP_NONE = 0xFFFFFFFF
+SNAP_DIR = '/dev/shm'                           # Preferred snapshot directory (tmpfs)
+SNAP_HEADER = struct.Struct('<4sHHIIIIQQQQ')    # magic, version, reserved, n_strings, n_omtypes, n_terrain, n_furniture,
+                                                # strtab_off, omtypes_off, terrain_off, furniture_off
+SNAP_OMTYPE = np.dtype([('key', '<u4'), ('osym', '<u4'), ('id', '<u4'), ('sym', '<u4'), ('color', '<u4'),
+                        ('name', '<u4'), ('looks_like', '<u4'), ('flags', '<u4')])
+SNAP_SYMBOL = np.dtype([('key', '<u4'), ('sym', '<u4'), ('fg', 'u1', 3), ('bg', 'u1', 3), ('has_bg', 'u1'),
+                        ('pad', 'u1')])
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot file cannot be written or read
+    """
+    pass
+
+class _SnapshotKeys(object):
+    """
+    Sequence of encoded record keys, for bisect
+    """
+    def __init__(self, snapshot, records):
+        self._snapshot = snapshot
+        self._keys = records['key']
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __getitem__(self, idex):
+        return self._snapshot.get_bytes(self._keys[idex])
+
+class SnapshotTable(object):
+    """
+    Read-only mapping of terrain or furniture id -> (sym, fg, bg), as from build_symbol_table()
+    Records are decoded on first lookup and memoized, so repeated lookups are a dict get
+    """
+    _snapshot = None
+    _records = None
+    _keys = None
+    _cache = None
+
+    def __init__(self, snapshot, records):
+        self._snapshot = snapshot
+        self._records = records
+        self._keys = _SnapshotKeys(snapshot, records)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, tid, default=None):
+        try:
+            return self._cache[tid]
+        except KeyError:
+            pass
+
+        rdex = self._snapshot.find(self._keys, tid)
+        if rdex is None:
+            tval = default
+        else:
+            trec = self._records[rdex]
+            tval = (self._snapshot.get_string(trec['sym']), tuple(trec['fg'].tolist()),
+                    tuple(trec['bg'].tolist()) if trec['has_bg'] else None)
+        self._cache[tid] = tval
+        return tval
+
+class GameDataSnapshot(object):
+    """
+    Memory-mapped, read-only view of a snapshot written by write_snapshot()
+    Usable in place of GameData for OvermapTile.resolve_symbols(), and in place of
+    the build_symbol_table() dict for submap rendering
+    """
+    path = None
+    terrain = None          # SnapshotTable of terrain symbols
+    furniture = None        # SnapshotTable of furniture symbols
+    _fd = None
+    _mm = None
+    _stroffs = None         # uint32 array of string offsets into the string blob
+    _blob_off = 0           # file offset of the string blob
+    _omtypes = None         # SNAP_OMTYPE record array
+    _omkeys = None
+    _omcache = None         # dict of omtype -> (osym, overmap_terrain)
+
+    def __init__(self, path):
+        self.path = path
+        self._omcache = {}
+        self._open()
+
+    def _open(self):
+        """
+        Map snapshot file and create array views of each table
+        The file is closed again if it cannot be read
+        """
+        self._fd = open(self.path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+            n_omtypes, n_terrain, n_furniture = self._read_tables()
+        except Exception as e:
+            self.close()
+            if isinstance(e, SnapshotError):
+                raise
+            raise SnapshotError("failed to read snapshot file '%s': %s" % (self.path, str(e)))
+
+        logger.debug("attached snapshot %s (%d omtypes, %d terrain, %d furniture)",
+                     self.path, n_omtypes, n_terrain, n_furniture)
+
+    def _read_tables(self):
+        """
+        Read header and create array views of each table, checking all offsets against the file length
+        @returns (n_omtypes, n_terrain, n_furniture)
+        """
+        fsize = len(self._mm)
+        if fsize < SNAP_HEADER.size:
+            raise SnapshotError("snapshot '%s' is truncated" % (self.path))
+
+        magic, version, _, n_strings, n_omtypes, n_terrain, n_furniture, \
+            strtab_off, omtypes_off, terrain_off, furniture_off = SNAP_HEADER.unpack_from(self._mm, 0)
+        if magic != SNAP_MAGIC:
+            raise SnapshotError("'%s' is not a catamap snapshot file" % (self.path))
+        if version != SNAP_VERSION:
+            raise SnapshotError("unsupported snapshot version %d in '%s'" % (version, self.path))
+
+        self._blob_off = strtab_off + ((n_strings + 1) * 4)
+        if self._blob_off > fsize:
+            raise SnapshotError("snapshot '%s' is truncated" % (self.path))
+        self._stroffs = np.frombuffer(self._mm, dtype='<u4', count=n_strings + 1, offset=strtab_off)
+        if self._blob_off + int(self._stroffs[-1]) > fsize:
+            raise SnapshotError("snapshot '%s' is truncated" % (self.path))
+        for toff, tcount, tdtype in ((omtypes_off, n_omtypes, SNAP_OMTYPE), (terrain_off, n_terrain, SNAP_SYMBOL),
+                                     (furniture_off, n_furniture, SNAP_SYMBOL)):
+            if toff + (tcount * tdtype.itemsize) > fsize:
+                raise SnapshotError("snapshot '%s' is truncated" % (self.path))
+
+        self._omtypes = np.frombuffer(self._mm, dtype=SNAP_OMTYPE, count=n_omtypes, offset=omtypes_off)
+        self._omkeys = _SnapshotKeys(self, self._omtypes)
+        self.terrain = SnapshotTable(self, np.frombuffer(self._mm, dtype=SNAP_SYMBOL, count=n_terrain, offset=terrain_off))
+        self.furniture = SnapshotTable(self, np.frombuffer(self._mm, dtype=SNAP_SYMBOL, count=n_furniture,
+                                                           offset=furniture_off))
+        return (n_omtypes, n_terrain, n_furniture)
+
+    def get_bytes(self, sdex):
+        """
+        Returns encoded string @sdex from the string table
+        """
+        return self._mm[self._blob_off + int(self._stroffs[sdex]):self._blob_off + int(self._stroffs[sdex + 1])]
+
+    def get_string(self, sdex):
+        """
+        Returns string @sdex from the string table, or None for SNAP_NONE
+        """
+        if sdex == SNAP_NONE:
+            return None
+        return self.get_bytes(sdex).decode('utf-8')
+
+    def find(self, keys, key):
+        """
+        Returns index of @key in sorted @keys, or None if not found
+        """
+        tkey = key.encode('utf-8')
+        rdex = bisect.bisect_left(keys, tkey)
+        if rdex < len(keys) and keys[rdex] == tkey:
+            return rdex
+        return None
+
+    def resolve_omtype(self, omtype):
+        """
+        Returns (osym, overmap_terrain) for @omtype, as resolve_omtype() does for GameData
+        @overmap_terrain is a dict with only the fields used for rendering
+        """
+        try:
+            return self._omcache[omtype]
+        except KeyError:
+            pass
+
+        rdex = self.find(self._omkeys, omtype)
+        if rdex is None:
+            tval = (None, None)
+        else:
+            trec = self._omtypes[rdex]
+            # missing fields are left out, so .get() defaults work as with game data
+            oter = {}
+            for tkey in ('id', 'sym', 'color', 'name', 'looks_like'):
+                if trec[tkey] != SNAP_NONE:
+                    oter[tkey] = self.get_string(trec[tkey])
+            tflags = self.get_string(trec['flags'])
+            oter['flags'] = tflags.split(',') if tflags else []
+            tval = (self.get_string(trec['osym']), oter)
+        self._omcache[omtype] = tval
+        return tval
+
+    def __getitem__(self, ttype):
+        if ttype == 'terrain':
+            return self.terrain
+        elif ttype == 'furniture':
+            return self.furniture
+        raise KeyError(ttype)
+
+    def close(self):
+        """
+        Unmap snapshot file
+        """
+        if self._mm is not None:
+            # drop array views first, since they hold exported pointers into the map
+            self._stroffs = self._omtypes = self._omkeys = self.terrain = self.furniture = None
+            self._mm.close()
+            self._mm = None
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+def omtype_variants(oterrain):
+    """
+    Returns every omtype that can resolve against dict of overmap_terrain @oterrain:
+    each id, each id with a compass suffix, and each LINEAR id with a line suffix
+    """
+    variants = set()
+    for tid, tobj in oterrain.items():
+        if tobj.get('id') is None:
+            continue
+        variants.add(tid)
+        variants.update('%s_%s' % (tid, x) for x in URDIST)
+        if 'LINEAR' in tobj.get('flags', []):
+            variants.update('%s_%s' % (tid, x) for x in ULINES)
+    return variants
+
+def _text(tval):
+    """
+    Normalize an overmap_terrain text field, which may be a list or a translation object
+    """
+    if isinstance(tval, list):
+        tval = tval[0] if tval else None
+    if isinstance(tval, dict):
+        tval = tval.get('str')
+    return tval if isinstance(tval, str) else None
+
+def write_snapshot(gdata: GameData, outpath):
+    """
+    Resolve overmap terrain, terrain and furniture from @gdata and write them to snapshot file @outpath
+    Tables for data types not loaded in @gdata are left empty
+    @returns Number of omtypes written
+    """
+    strings = []
+    sids = {}
+
+    def _sid(tval):
+        if tval is None:
+            return SNAP_NONE
+        if tval not in sids:
+            sids[tval] = len(strings)
+            strings.append(tval)
+        return sids[tval]
+
+    try:
+        oterrain = gdata['overmap_terrain']
+    except KeyError:
+        logger.warning("no overmap_terrain loaded in game data")
+        oterrain = {}
+
+    omtypes = []
+    for omtype in sorted(omtype_variants(oterrain), key=lambda x: x.encode('utf-8')):
+        osym, oter = resolve_omtype(omtype, oterrain)
+        if oter is None:
+            continue
+        tflags = oter.get('flags', [])
+        omtypes.append((_sid(omtype), _sid(osym), _sid(_text(oter.get('id'))), _sid(_text(oter.get('sym'))),
+                        _sid(_text(oter.get('color'))), _sid(_text(oter.get('name'))),
+                        _sid(_text(oter.get('looks_like'))),
+                        _sid(','.join(x for x in tflags if isinstance(x, str)))))
+    omtypes = np.array(omtypes, dtype=SNAP_OMTYPE)
+
+    try:
+        gdata['terrain']
+        symtab = build_symbol_table(gdata)
+    except KeyError:
+        # overmap-only game data (eg. default C_SUBDIRS)
+        symtab = {'terrain': {}, 'furniture': {}}
+    tables = []
+    for ttype in ('terrain', 'furniture'):
+        records = []
+        for tid in sorted(symtab[ttype], key=lambda x: x.encode('utf-8')):
+            sym, fg, bg = symtab[ttype][tid]
+            records.append((_sid(tid), _sid(sym), fg, bg or (0, 0, 0), bg is not None, 0))
+        tables.append(np.array(records, dtype=SNAP_SYMBOL))
+
+    blob = [x.encode('utf-8') for x in strings]
+    stroffs = np.zeros(len(blob) + 1, dtype='<u4')
+    stroffs[1:] = np.cumsum([len(x) for x in blob])
+
+    tmppath = outpath + '.tmp'
+    with open(tmppath, 'wb') as f:
+        f.write(b'\0' * SNAP_HEADER.size)
+        strtab_off = pad_to(f, SNAP_ALIGN)
+        f.write(stroffs.tobytes())
+        f.write(b''.join(blob))
+        offsets = []
+        for trecs in [omtypes] + tables:
+            offsets.append(pad_to(f, SNAP_ALIGN))
+            f.write(trecs.tobytes())
+
+        f.seek(0)
+        f.write(SNAP_HEADER.pack(SNAP_MAGIC, SNAP_VERSION, 0, len(strings), len(omtypes), len(tables[0]),
+                                 len(tables[1]), strtab_off, *offsets))
+
+    os.replace(tmppath, outpath)
+    logger.debug("wrote snapshot %s (%d omtypes, %d terrain, %d furniture, %d strings)",
+                 outpath, len(omtypes), len(tables[0]), len(tables[1]), len(strings))
+    return len(omtypes)
+
+def create_snapshot(gdata: GameData):
+    """
+    Write a snapshot of @gdata to a new temporary file, preferring shared memory (SNAP_DIR)
+    The caller is responsible for removing the file once all workers are finished
+    @returns Path of the snapshot file
+    """
+    tdir = SNAP_DIR if os.path.isdir(SNAP_DIR) and os.access(SNAP_DIR, os.W_OK) else None
+    fd, snappath = tempfile.mkstemp(prefix='catamap-', suffix='.snap', dir=tdir)
+    os.close(fd)
+    try:
+        write_snapshot(gdata, snappath)
+    except BaseException:
+        # also on SystemExit from a signal handler
+        os.unlink(snappath)
+        raise
+    return snappath
@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+"""
+
+catamap.tileset
+Load CDDA tilesets for sprite rendering
+
+License: GPLv3
+Repo: <https://git.ycnrg.org/projects/GTOOL/repos/catamap>
+
+Copyright (c) 2019 J. Hipps <jacob@ycnrg.org>
+https://ycnrg.org/
+
+
+[tileset]/tile_config.json - Tile definitions, with one 'tiles-new' entry per sprite sheet
+[tileset]/*.png - Sprite sheets; sprite indexes run across all sheets, in 'tiles-new' order
+
+"""
+
+import os
+import json
+import bisect
+import logging
+
+from PIL import Image
+
+from catamap.parse_overmap import ULINES, URDIST
+from catamap import __version__, __date__
+
+logger = logging.getLogger('catamap')
+
+# ULINES connection mask (N=1, E=2, S=4, W=8) -> (multitile subtile, rotation)
+# Rotations are in 90 degree counter-clockwise steps, following the game
+MULTITILE_ROT = {
+    0:  ('unconnected', 0),
+    15: ('center', 0),
+    4:  ('end_piece', 0),
+    2:  ('end_piece', 1),
+    1:  ('end_piece', 2),
+    8:  ('end_piece', 3),
+    5:  ('edge', 0),
+    10: ('edge', 1),
+    6:  ('corner', 0),
+    3:  ('corner', 1),
+    9:  ('corner', 2),
+    12: ('corner', 3),
+    14: ('t_connection', 0),
+    7:  ('t_connection', 1),
+    11: ('t_connection', 2),
+    13: ('t_connection', 3),
+}
+
+
+class Tileset(object):
+    """
+    Loads a tileset's tile_config.json and sprite sheets
+    Sprites are sliced, scaled and rotated on first use, then cached
+    """
+    path = None
+    tiles = None            # dict of tile id -> tile_config entry
+    sheets = None           # list of sprite sheet dicts, in sprite index order
+    tile_w = 0              # Output tile width
+    tile_h = 0              # Output tile height
+    scale = 1.0             # Output scale, relative to tileset tile size
+    _starts = None          # first sprite index of each sheet, for bisect
+    _sprites = None         # dict of (index, rot) -> (Image, mask, offset_x, offset_y)
+    _lookup = None          # dict of omtype -> list of (index, rot), or None
+
+    def __init__(self, path, tilesize=None):
+        self.path = os.path.realpath(os.path.expanduser(path))
+        self.tiles = {}
+        self.sheets = []
+        self._starts = []
+        self._sprites = {}
+        self._lookup = {}
+        self.load_config(tilesize)
+
+    def load_config(self, tilesize=None):
+        """
+        Parse tile_config.json and index sprite sheets
+        Sheet images are only opened to read their size
+        """
+        with open(os.path.join(self.path, 'tile_config.json')) as f:
+            tconfig = json.load(f)
+
+        tinfo = tconfig.get('tile_info', [{}])[0]
+        base_w = tinfo.get('width', 16)
+        base_h = tinfo.get('height', 16)
+        pixelscale = tinfo.get('pixelscale', 1)
+        self.scale = (tilesize / base_w) if tilesize else pixelscale
+        self.tile_w = int(base_w * self.scale)
+        self.tile_h = int(base_h * self.scale)
+
+        if 'tiles-new' not in tconfig:
+            logger.error("%s: legacy tilesets without 'tiles-new' are not supported", self.path)
+
+        sdex = 0
+        for tsheet in tconfig.get('tiles-new', []):
+            sw = tsheet.get('sprite_width', base_w)
+            sh = tsheet.get('sprite_height', base_h)
+            fpath = os.path.join(self.path, tsheet['file'])
+            try:
+                with Image.open(fpath) as im:
+                    im_w, im_h = im.size
+            except Exception as e:
+                logger.error("failed to open sprite sheet '%s': %s", fpath, str(e))
+                continue
+
+            self.sheets.append({
+                'file': fpath,
+                'start': sdex,
+                'cols': im_w // sw,
+                'sw': sw,
+                'sh': sh,
+                'ox': tsheet.get('sprite_offset_x', 0),
+                'oy': tsheet.get('sprite_offset_y', 0),
+                'im': None,
+            })
+            self._starts.append(sdex)
+            sdex += (im_w // sw) * (im_h // sh)
+
+            for tentry in tsheet.get('tiles', []):
+                tids = tentry.get('id')
+                for tid in (tids if isinstance(tids, list) else [tids]):
+                    self.tiles[tid] = tentry
+
+        logger.debug("loaded tileset %s: %d tiles, %d sprites in %d sheets (tile size %dx%d)",
+                     self.path, len(self.tiles), sdex, len(self.sheets), self.tile_w, self.tile_h)
+
+    def get_sprite(self, index, rot=0):
+        """
+        Returns (Image, mask, offset_x, offset_y) for sprite @index rotated @rot steps counter-clockwise
+        @mask is None for fully opaque sprites, so they can be pasted without blending
+        """
+        sprite = self._sprites.get((index, rot))
+        if sprite is not None:
+            return sprite
+
+        sheet = self.sheets[bisect.bisect_right(self._starts, index) - 1]
+        if sheet['im'] is None:
+            sheet['im'] = Image.open(sheet['file']).convert('RGBA')
+
+        sdex = index - sheet['start']
+        sx = (sdex % sheet['cols']) * sheet['sw']
+        sy = (sdex // sheet['cols']) * sheet['sh']
+        im = sheet['im'].crop((sx, sy, sx + sheet['sw'], sy + sheet['sh']))
+        if self.scale != 1:
+            im = im.resize((int(sheet['sw'] * self.scale), int(sheet['sh'] * self.scale)), Image.NEAREST)
+        if rot:
+            im = im.rotate(90 * rot, expand=True)
+
+        mask = im if im.getextrema()[3][0] < 255 else None
+        sprite = (im, mask, int(sheet['ox'] * self.scale), int(sheet['oy'] * self.scale))
+        self._sprites[(index, rot)] = sprite
+        return sprite
+
+    def resolve(self, omtype, overmap_terrain=None):
+        """
+        Returns a list of (sprite index, rot) to draw for @omtype, background first,
+        or None if the tileset has no matching tile.
+        @overmap_terrain is the resolved overmap_terrain for @omtype, if any.
+        Results are cached per omtype for the lifetime of the tileset.
+        """
+        try:
+            return self._lookup[omtype]
+        except KeyError:
+            pass
+
+        slist = self._resolve(omtype, overmap_terrain)
+        if slist is None:
+            logger.debug("no tileset sprite for %s", omtype)
+        self._lookup[omtype] = slist
+        return slist
+
+    def _resolve(self, omtype, overmap_terrain):
+        # exact match (eg. 'road_ns' defined directly by the tileset)
+        if omtype in self.tiles:
+            return self._entry_sprites(self.tiles[omtype], 0)
+
+        if overmap_terrain is None:
+            return None
+        base_id = overmap_terrain.get('id', omtype)
+        suffix = omtype[len(base_id) + 1:] if omtype.startswith(base_id + '_') else None
+
+        for tid in (base_id, overmap_terrain.get('looks_like')):
+            tentry = self.tiles.get(tid)
+            if tentry is None:
+                continue
+
+            # linear terrain (roads, rivers, etc.) uses multitile subtiles
+            if suffix in ULINES and 'LINEAR' in overmap_terrain.get('flags', []):
+                subtile, rot = MULTITILE_ROT[ULINES[suffix][3]]
+                for tsub in tentry.get('additional_tiles', []):
+                    if tsub.get('id') == subtile:
+                        return self._entry_sprites(tsub, rot)
+                return self._entry_sprites(tentry, 0)
+
+            rot = URDIST.get(suffix, 0) if tentry.get('rotates') else 0
+            return self._entry_sprites(tentry, rot)
+
+        return None
+
+    def _entry_sprites(self, tentry, rot):
+        """
+        Returns list of (sprite index, rot) for bg & fg of tile_config entry @tentry
+        When a rotating entry defines one sprite per direction, the matching
+        sprite is used unrotated; otherwise the first sprite is rotated
+        """
+        slist = []
+        for tkey in ('bg', 'fg'):
+            tsprites = _sprite_ids(tentry.get(tkey))
+            if not tsprites:
+                continue
+            if len(tsprites) == 4 and tentry.get('rotates'):
+                slist.append((tsprites[rot], 0))
+            else:
+                slist.append((tsprites[0], rot))
+        return slist or None
+
+def _sprite_ids(tval):
+    """
+    Normalize a tile_config fg/bg value to a list of sprite indexes
+    Weighted variants are reduced to the first variant
+    """
+    if tval is None:
+        return []
+    if isinstance(tval, int):
+        return [tval]
+    if tval and isinstance(tval[0], dict):
+        return _sprite_ids(tval[0].get('sprite'))
+    return [x for x in tval if isinstance(x, int)]
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+"""
+
+catamap.visibility
+Per-character overmap visibility (fog of war)
+
+License: GPLv3
+Repo: <https://git.ycnrg.org/projects/GTOOL/repos/catamap>
+
+Copyright (c) 2019 J. Hipps <jacob@ycnrg.org>
+https://ycnrg.org/
+
+
+Save filename formats (all files JSON with optional comment on line 1):
+
+[savedir]/#CHARNAME.seen.OMT_X.OMT_Y - Seen & explored OMTs for overmap at OMT_X, OMT_Y
+                                       (CHARNAME is base64-encoded character name)
+
+Visibility is stored as packed bitsets, shape (Z_LEVELS, SEEN_BYTES), one bit per OMT in row order.
+
+"""
+
+import os
+import re
+import base64
+import logging
+
+import numpy as np
+
+from catamap.parse_overmap import read_save_json, unpack_seen, OMT_SZ, SEG_SZ, Z_MIN, Z_LEVELS
+from catamap import __version__, __date__
+
+logger = logging.getLogger('catamap')
+
+SEEN_BYTES = (OMT_SZ * OMT_SZ) // 8     # Packed bytes per Z-level
+
+
+def read_seen_file(filename):
+    """
+    Read a single .seen file into a packed bitset of seen or explored OMTs
+    """
+    sjson = read_save_json(filename)
+
+    seen = np.zeros((Z_LEVELS, OMT_SZ * OMT_SZ), dtype=bool)
+    for tkey in ('visible', 'explored'):
+        # layers are run-length encoded as [bool, count], from Z-level -10 up through +10
+        for zdex, tlayer in enumerate(sjson.get(tkey, [])[:Z_LEVELS]):
+            if not tlayer:
+                continue
+            tline = np.repeat(np.array([x[0] for x in tlayer], dtype=bool), [x[1] for x in tlayer])
+            seen[zdex, :len(tline)] |= tline[:OMT_SZ * OMT_SZ]
+    return np.packbits(seen, axis=1)
+
+def char_name(prefix):
+    """
+    Decode character name from .seen file prefix, eg. '#Sm9obiBEb2U=' -> 'John Doe'
+    Returns @prefix unchanged if it cannot be decoded
+    """
+    try:
+        return base64.b64decode(prefix.lstrip('#')).decode('utf-8')
+    except Exception:
+        return prefix
+
+class Visibility(object):
+    """
+    Loads seen data for all characters (or only @characters) in a world save directory
+    Characters are merged with a bitwise OR, so an OMT seen by anyone is visible
+    """
+    path = None
+    characters = None       # list of character names included
+    unmatched = None        # list of requested characters without any seen data
+    tindex = None           # dict of (x, y) -> list of .seen filenames
+    _seen = None            # dict of (x, y) -> packed bitset, merged across characters
+
+    def __init__(self, path, characters=None):
+        self.path = os.path.realpath(os.path.expanduser(path))
+        self.characters = []
+        self.unmatched = []
+        self.tindex = {}
+        self._seen = {}
+        self.load_index(characters)
+
+    def load_index(self, characters=None):
+        """
+        Index .seen files in save directory, optionally only for @characters
+        @characters may be character names or raw filename prefixes
+        """
+        r_seen = re.compile(r'^(?P<char>.+)\.seen\.(?P<om_x>[\-0-9]+)\.(?P<om_y>[\-0-9]+)$')
+        matched = set()
+        try:
+            for tfile in os.scandir(self.path):
+                tmatch = r_seen.match(tfile.name)
+                if not tmatch:
+                    continue
+                tprefix = tmatch.group('char')
+                tchar = char_name(tprefix)
+                if characters and tchar not in characters and tprefix not in characters:
+                    continue
+                matched.update((tchar, tprefix))
+                if tchar not in self.characters:
+                    self.characters.append(tchar)
+                tcoord = (int(tmatch.group('om_x')), int(tmatch.group('om_y')))
+                self.tindex.setdefault(tcoord, []).append(tfile.path)
+        except Exception as e:
+            logger.error("failed to load seen data: %s", str(e))
+            return False
+        self.unmatched = [x for x in (characters or []) if x not in matched]
+        logger.debug("indexed seen data for %d overmaps (characters: %s)", len(self.tindex), ', '.join(self.characters))
+        return True
+
+    def get_seen(self, x, y):
+        """
+        Returns packed bitset of OMTs seen by any character for overmap at x,y
+        Overmaps without seen data are entirely unseen
+        """
+        seen = self._seen.get((x, y))
+        if seen is not None:
+            return seen
+
+        seen = np.zeros((Z_LEVELS, SEEN_BYTES), dtype=np.uint8)
+        for tfile in self.tindex.get((x, y), []):
+            try:
+                seen |= read_seen_file(tfile)
+            except Exception as e:
+                logger.warning("failed to read seen data from '%s': %s", tfile, str(e))
+        self._seen[(x, y)] = seen
+        return seen
+
+    def is_unseen(self, x, y, zlevels=None):
+        """
+        Returns True if no OMT of overmap at x,y was seen at any of @zlevels (default: all)
+        """
+        if (x, y) not in self.tindex:
+            return True
+        seen = self.get_seen(x, y)
+        if zlevels is None:
+            return not seen.any()
+        return not any(seen[z - Z_MIN].any() for z in zlevels)
+
+    def get_segment_seen(self, seg_x, seg_y, seg_z):
+        """
+        Returns a packed (SEG_SZ, SEG_SZ) bitset of seen OMTs in segment at seg_x, seg_y, seg_z
+        """
+        seen = np.zeros((SEG_SZ, SEG_SZ), dtype=bool)
+        omt_x0 = seg_x * SEG_SZ
+        omt_y0 = seg_y * SEG_SZ
+        for ox in range(omt_x0 // OMT_SZ, ((omt_x0 + SEG_SZ - 1) // OMT_SZ) + 1):
+            for oy in range(omt_y0 // OMT_SZ, ((omt_y0 + SEG_SZ - 1) // OMT_SZ) + 1):
+                if (ox, oy) not in self.tindex:
+                    continue
+                omask = unpack_seen(self.get_seen(ox, oy), seg_z)
+
+                # intersect segment with this overmap, in absolute OMT coordinates
+                ax1 = max(omt_x0, ox * OMT_SZ)
+                ax2 = min(omt_x0 + SEG_SZ, (ox + 1) * OMT_SZ)
+                ay1 = max(omt_y0, oy * OMT_SZ)
+                ay2 = min(omt_y0 + SEG_SZ, (oy + 1) * OMT_SZ)
+                seen[ay1 - omt_y0:ay2 - omt_y0, ax1 - omt_x0:ax2 - omt_x0] = \
+                    omask[ay1 - oy * OMT_SZ:ay2 - oy * OMT_SZ, ax1 - ox * OMT_SZ:ax2 - ox * OMT_SZ]
+        return np.packbits(seen)
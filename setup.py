@@ -15,7 +15,7 @@ setup(
     packages = find_packages(),
     scripts = [],
 
-    install_requires = ['arrow', 'requests'],
+    install_requires = ['arrow', 'requests', 'numpy', 'Pillow>=9.2'],
 
     package_data = {
         '': [ '*.md' ],
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+"""
+
+Round-trip tests for catamap.export
+
+"""
+
+import os
+import json
+
+import numpy as np
+import pytest
+
+from catamap.export import OvermapExport, ExportError, export_world
+from catamap.parse_overmap import World, read_overmap_layers, OMT_SZ, Z_MIN, Z_LEVELS, NO_TERRAIN
+
+
+def _write_overmap(path, name, layer0, layer_m1=None):
+    """
+    Write an overmap JSON file with RLE layers for Z-levels 0 and -1; all others are empty
+    """
+    layers = [[] for _ in range(Z_LEVELS)]
+    layers[0 - Z_MIN] = layer0
+    if layer_m1 is not None:
+        layers[-1 - Z_MIN] = layer_m1
+    with open(os.path.join(path, name), 'w') as f:
+        f.write('# version 33\n')
+        json.dump({'layers': layers, 'cities': []}, f)
+
+@pytest.fixture
+def world(tmp_path):
+    cells = OMT_SZ * OMT_SZ
+    _write_overmap(str(tmp_path), 'o.0.0', [['field', cells - 400], ['road_ns', 400]],
+                   [['rock', cells]])
+    # different terrain order, so per-overmap ids must be remapped into the shared table
+    _write_overmap(str(tmp_path), 'o.1.0', [['forest', 100], ['road_ns', 50], ['field', cells - 150]])
+    return World(str(tmp_path), None)
+
+def test_export_round_trip(world, tmp_path):
+    outpath = str(tmp_path / 'world.cmap')
+    assert export_world(world, outpath) == 2
+    assert not os.path.exists(outpath + '.tmp')
+
+    export = OvermapExport(outpath)
+    try:
+        assert export.list_tiles() == [(0, 0), (1, 0)]
+        for omt_x, omt_y in export.list_tiles():
+            terrain, layers = read_overmap_layers(world.tindex[(omt_x, omt_y)])
+            elayers = export.get_layers(omt_x, omt_y)
+            assert elayers.shape == layers.shape
+
+            # NO_TERRAIN cells must match, and every other cell must name the same omtype
+            empty = layers == NO_TERRAIN
+            assert np.array_equal(elayers == NO_TERRAIN, empty)
+            jnames = np.array(terrain, dtype=object)[layers[~empty]]
+            enames = np.array(export.terrain, dtype=object)[elayers[~empty]]
+            assert np.array_equal(jnames, enames)
+            # views into the map must be released before close()
+            del elayers
+        assert sorted(export.terrain) == ['field', 'forest', 'road_ns', 'rock']
+    finally:
+        export.close()
+
+def test_export_truncated(world, tmp_path):
+    outpath = str(tmp_path / 'world.cmap')
+    export_world(world, outpath)
+    with open(outpath, 'r+b') as f:
+        f.truncate(os.path.getsize(outpath) - 3)
+    with pytest.raises(ExportError):
+        OvermapExport(outpath)
+
+def test_export_not_an_export(tmp_path):
+    outpath = str(tmp_path / 'bogus.cmap')
+    with open(outpath, 'wb') as f:
+        f.write(b'\0' * 16)
+    with pytest.raises(ExportError):
+        OvermapExport(outpath)
+
+def test_export_nothing_readable(tmp_path):
+    with open(str(tmp_path / 'o.0.0'), 'w') as f:
+        f.write('# version 33\nnot json')
+    outpath = str(tmp_path / 'world.cmap')
+    assert export_world(World(str(tmp_path), None), outpath) == 0
+    assert not os.path.exists(outpath) and not os.path.exists(outpath + '.tmp')
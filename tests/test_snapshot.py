@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+"""
+
+Round-trip tests for catamap.snapshot
+
+"""
+
+import pytest
+
+from catamap.snapshot import GameDataSnapshot, SnapshotError, write_snapshot
+
+
+@pytest.fixture
+def snappath(tmp_path):
+    # overmap-only game data, so the terrain and furniture tables are empty
+    gdata = {'overmap_terrain': {
+        'field': {'id': 'field', 'sym': '.', 'color': 'brown', 'name': 'field'},
+        'road': {'id': 'road', 'sym': 'LINE_XOXO', 'color': 'dark_gray', 'name': 'road', 'flags': ['LINEAR']},
+    }}
+    outpath = str(tmp_path / 'gdata.snap')
+    write_snapshot(gdata, outpath)
+    return outpath
+
+def test_snapshot_round_trip(snappath):
+    snap = GameDataSnapshot(snappath)
+    try:
+        osym, oter = snap.resolve_omtype('field')
+        assert oter['name'] == 'field' and oter['flags'] == []
+        assert snap.resolve_omtype('road_ns')[1]['flags'] == ['LINEAR']
+        assert snap.resolve_omtype('nonexistent') == (None, None)
+        assert len(snap.terrain) == 0 and snap.terrain.get('t_dirt') is None
+    finally:
+        snap.close()
+
+def test_snapshot_truncated(snappath):
+    with open(snappath, 'rb') as f:
+        data = f.read()
+    for tlen in (2, 64, len(data) - 3):
+        with open(snappath, 'wb') as f:
+            f.write(data[:tlen])
+        with pytest.raises(SnapshotError):
+            GameDataSnapshot(snappath)
+
+def test_snapshot_not_a_snapshot(tmp_path):
+    outpath = str(tmp_path / 'bogus.snap')
+    with open(outpath, 'wb') as f:
+        f.write(b'\0' * 128)
+    with pytest.raises(SnapshotError):
+        GameDataSnapshot(outpath)